@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Queue a whole campaign of posts from one template and one manifest
+
+The template is a post.yaml whose text fields may contain $placeholders:
+
+    caption: |
+      $title - see you at $venue on $date
+    hashtags: [campaign2025, $city]
+    scheduled_publish_time: "$publish_at"
+
+The manifest is a CSV (with a header row) or JSONL file with one post per row.
+Every row needs a `folder` column (media folder, relative to the manifest) and
+a value for every placeholder; columns named like a post.yaml key (location,
+scheduled_publish_time, ...) override the template for that row.
+
+    python instagram/posts/campaign.py template.yaml manifest.csv --spool spool
+
+All rows are validated (placeholders, media folder, preflight checks, schedule)
+before the first job is queued, then each row becomes a "post" job for the
+posting worker (utils/posting_worker.py).
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+from string import Template
+from datetime import datetime
+
+import yaml
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from instagram_post import build_post_config, get_media_files
+from utils.preflight import run_preflight
+from utils.posting_worker import submit_job
+from utils.scheduler import parse_scheduled_time
+
+# post.yaml keys a manifest column may override directly
+CONFIG_KEYS = (
+    'caption', 'hashtags', 'alt_text', 'location', 'user_tags', 'product_tags',
+    'branded_content_partner', 'disable_comments', 'hide_like_count', 'collaborators',
+    'scheduled_publish_time', 'allow_duplicates', 'carousel_failure_policy', 'notes'
+)
+LIST_KEYS = ('hashtags', 'user_tags', 'product_tags', 'collaborators')
+BOOL_KEYS = ('disable_comments', 'hide_like_count', 'allow_duplicates')
+# Stop collecting errors after this many, the campaign is rejected either way
+MAX_REPORTED_ERRORS = 50
+
+def compile_value(value):
+    """Turn the strings of a template value into string.Template objects"""
+    if isinstance(value, str):
+        return Template(value)
+    if isinstance(value, list):
+        return [compile_value(item) for item in value]
+    if isinstance(value, datetime):
+        # YAML parses unquoted timestamps; keep them as the text post.yaml expects
+        return Template(value.strftime('%Y-%m-%d %H:%M:%S'))
+    return value
+
+def render_value(value, variables):
+    """Fill a compiled template value with one row's variables"""
+    if isinstance(value, Template):
+        return value.substitute(variables)
+    if isinstance(value, list):
+        return [render_value(item, variables) for item in value]
+    return value
+
+def template_identifiers(value):
+    """Placeholders used by a compiled template value"""
+    if isinstance(value, Template):
+        return set(value.get_identifiers())
+    if isinstance(value, list):
+        return set().union(*(template_identifiers(item) for item in value)) if value else set()
+    return set()
+
+def parse_override(key, value):
+    """Convert a manifest cell to the type post.yaml uses for that key"""
+    if not isinstance(value, str):
+        return value
+    if key in LIST_KEYS:
+        return [item.strip() for item in value.replace(',', ' ').split() if item.strip()]
+    if key in BOOL_KEYS:
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return value
+
+class CampaignTemplate:
+    """A post.yaml template compiled once and rendered for every manifest row"""
+
+    def __init__(self, template_file):
+        with open(template_file, 'r') as f:
+            data = yaml.safe_load(f) or {}
+        self.fields = {key: compile_value(value) for key, value in data.items()}
+        self.identifiers = set()
+        for value in self.fields.values():
+            self.identifiers |= template_identifiers(value)
+
+    def render(self, row):
+        """
+        Build the post configuration for one manifest row
+
+        Returns:
+            dict: Configuration in the format parse_post_config returns
+        """
+        data = {key: render_value(value, row) for key, value in self.fields.items()}
+        for key in CONFIG_KEYS:
+            if row.get(key) not in (None, ''):
+                data[key] = parse_override(key, row[key])
+        return build_post_config(data)
+
+def iter_manifest(manifest_file):
+    """
+    Stream manifest rows without reading the whole file
+
+    Yields:
+        tuple: (line number, row dict)
+    """
+    if manifest_file.lower().endswith(('.jsonl', '.ndjson')):
+        with open(manifest_file, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {'__error__': f"invalid JSON ({e})"}
+                if not isinstance(row, dict):
+                    row = {'__error__': "row is not a JSON object"}
+                yield line_number, row
+    else:
+        with open(manifest_file, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+def row_folder(row, base_dir):
+    """Media folder of a row, relative paths being relative to the manifest"""
+    return os.path.normpath(os.path.join(base_dir, row['folder']))
+
+def validate_row(template, row, base_dir):
+    """
+    Check one manifest row without uploading anything
+
+    Returns:
+        list: Error messages, empty if the row can be queued
+    """
+    if '__error__' in row:
+        return [row['__error__']]
+
+    missing = sorted(name for name in template.identifiers if row.get(name) in (None, ''))
+    if missing:
+        return [f"missing value for {', '.join('$' + name for name in missing)}"]
+
+    if not row.get('folder'):
+        return ["no folder given"]
+    if not isinstance(row['folder'], str):
+        return ["folder is not a string"]
+    folder = row_folder(row, base_dir)
+    media_files = get_media_files(folder) if os.path.isdir(folder) else []
+    if not media_files:
+        return [f"no media found in {folder}"]
+
+    try:
+        config = template.render(row)
+    except (KeyError, ValueError) as e:
+        return [f"template error: {e}"]
+
+    errors = []
+    try:
+        parse_scheduled_time(config['scheduled_publish_time'])
+    except ValueError as e:
+        errors.append(str(e))
+    if config['carousel_failure_policy'] not in ('abort', 'drop'):
+        errors.append(f"unknown carousel_failure_policy '{config['carousel_failure_policy']}'")
+    errors.extend(run_preflight(media_files, config)['errors'])
+    return errors
+
+def queue_campaign(template_file, manifest_file, spool_dir, dry_run=False, priority='scheduled'):
+    """
+    Validate a campaign manifest, then queue one post job per row
+
+    Nothing is queued if any row is invalid. `priority` is the jobs' lane in the
+    posting worker ('scheduled', or 'backfill' for bulk catch-up).
+
+    Returns:
+        dict: 'success', 'rows', 'queued' job count and 'errors'
+    """
+    template = CampaignTemplate(template_file)
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    campaign = os.path.splitext(os.path.basename(manifest_file))[0]
+
+    print(f"🔎 Validating {manifest_file}...")
+    rows = 0
+    errors = []
+    for line_number, row in iter_manifest(manifest_file):
+        rows += 1
+        for error in validate_row(template, row, base_dir):
+            errors.append(f"line {line_number}: {error}")
+        if len(errors) >= MAX_REPORTED_ERRORS:
+            errors.append("... stopped after too many errors")
+            break
+
+    if errors:
+        print(f"\n❌ Campaign rejected, nothing was queued:")
+        for error in errors:
+            print(f"  - {error}")
+        return {'success': False, 'rows': rows, 'queued': 0, 'errors': errors}
+
+    print(f"✅ {rows} row(s) valid")
+    if dry_run:
+        return {'success': True, 'rows': rows, 'queued': 0, 'errors': []}
+
+    # A shared prefix keeps the campaign's jobs in manifest order in the spool
+    prefix = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{campaign}"
+    queued = 0
+    for line_number, row in iter_manifest(manifest_file):
+        submit_job({
+            'id': f"{prefix}-{line_number:06d}",
+            'type': 'post',
+            'priority': priority,
+            'folder': row_folder(row, base_dir),
+            'config': template.render(row),
+        }, spool_dir)
+        queued += 1
+
+    print(f"📬 Queued {queued} post job(s) in {spool_dir}")
+    return {'success': True, 'rows': rows, 'queued': queued, 'errors': []}
+
+def main():
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description="Queue a templated Instagram campaign")
+    parser.add_argument('template', help="post.yaml template with $placeholders")
+    parser.add_argument('manifest', help="CSV or JSONL manifest, one post per row")
+    parser.add_argument('--spool', default=os.path.join(project_root, 'spool'), help="Posting worker spool directory")
+    parser.add_argument('--dry-run', action='store_true', help="Only validate the manifest")
+    parser.add_argument('--priority', default='scheduled', choices=['live', 'scheduled', 'backfill'],
+                        help="Worker priority lane of the queued jobs")
+    args = parser.parse_args()
+
+    result = queue_campaign(args.template, args.manifest, args.spool, args.dry_run, args.priority)
+    sys.exit(0 if result['success'] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,8 @@ import os
 import sys
 import re
 import glob
+import time
 import yaml
-import requests
 import cloudinary
 import cloudinary.uploader
 from dotenv import load_dotenv
@@ -12,6 +12,20 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env'))
 
+from utils.tag_resolver import TagResolver
+from utils.retry_policy import graph_request
+from utils.cloudinary_upload import upload_media
+from utils.profiling import enable_from_argv, profile_stage
+from utils.media_index import find_duplicates, record_published
+from utils.preflight import run_preflight
+from utils.container_status import wait_for_containers
+from utils.scheduler import parse_scheduled_time, publish_at
+from utils.insights import record_media
+from utils.upload_concurrency import get_upload_limiter
+from utils.priority import ContextExecutor
+from utils.faststart import ensure_faststart
+from utils.processing_predictor import wait_for_video
+
 # Configure Cloudinary
 cloudinary.config(
     cloud_name="dyemob08j",
@@ -21,21 +35,6 @@ cloudinary.config(
 
 def parse_post_config(yaml_file_path):
     """Parse the post.yaml file to extract configuration"""
-    config = {
-        'caption': '',
-        'hashtags': '',
-        'alt_text': '',
-        'location': '',
-        'user_tags': [],
-        'product_tags': [],
-        'branded_content_partner': '',
-        'disable_comments': False,
-        'hide_like_count': False,
-        'collaborators': [],
-        'scheduled_publish_time': '',
-        'notes': ''
-    }
-    
     # Try YAML file first
     if not os.path.exists(yaml_file_path):
         # Fall back to markdown file for backward compatibility
@@ -45,14 +44,35 @@ def parse_post_config(yaml_file_path):
             return parse_legacy_markdown(md_file_path)
         else:
             print(f"⚠️ No post.yaml found at {yaml_file_path}, using defaults")
-            return config
+            return build_post_config(None)
     
     with open(yaml_file_path, 'r') as f:
         try:
             data = yaml.safe_load(f)
         except yaml.YAMLError as e:
             print(f"❌ Error parsing YAML file: {e}")
-            return config
+            return build_post_config(None)
+    
+    return build_post_config(data)
+
+def build_post_config(data):
+    """Build the post configuration from post.yaml data (a dict, or None for defaults)"""
+    config = {
+        'caption': '',
+        'hashtags': '',
+        'alt_text': '',
+        'location': '',
+        'user_tags': [],
+        'product_tags': [],
+        'branded_content_partner': '',
+        'disable_comments': False,
+        'hide_like_count': False,
+        'collaborators': [],
+        'scheduled_publish_time': '',
+        'allow_duplicates': False,
+        'carousel_failure_policy': 'abort',
+        'notes': ''
+    }
     
     # Map YAML data to config
     if data:
@@ -79,6 +99,8 @@ def parse_post_config(yaml_file_path):
         config['hide_like_count'] = data.get('hide_like_count', False)
         config['collaborators'] = data.get('collaborators', [])
         config['scheduled_publish_time'] = data.get('scheduled_publish_time', '')
+        config['allow_duplicates'] = data.get('allow_duplicates', False)
+        config['carousel_failure_policy'] = data.get('carousel_failure_policy', 'abort')
         config['notes'] = data.get('notes', '')
     
     # Combine caption and hashtags
@@ -159,49 +181,124 @@ def upload_to_cloudinary(file_path):
     """Upload a single file to Cloudinary"""
     try:
         print(f"  ☁️ Uploading: {os.path.basename(file_path)}")
-        # Check if it's a video file
+        # Check if it's a video file (large files go up in parallel chunks, failures are retried).
+        # Instagram is given a variant sized and encoded for it instead of the original.
         if file_path.lower().endswith(('.mp4')):
-            upload_result = cloudinary.uploader.upload(file_path, resource_type="video")
+            upload_result = upload_media(file_path, resource_type="video", surface='reels')
         else:
-            upload_result = cloudinary.uploader.upload(file_path)
-        return upload_result['secure_url'], upload_result['public_id']
+            upload_result = upload_media(file_path, surface='feed')
+        return upload_result['delivery_url'], upload_result['public_id']
     except Exception as e:
         print(f"  ❌ Failed to upload {file_path}: {e}")
         return None, None
 
-def create_carousel_post(media_items, config):
-    """Create a carousel post with multiple images/videos"""
+def create_carousel_item(media_url, media_type):
+    """Create one carousel child container, returning (container_id, error)"""
     access_token = os.getenv('ACCESS_TOKEN')
     account_id = os.getenv('ACCOUNT_ID')
     
-    media_ids = []
+    url = f"https://graph.facebook.com/v18.0/{account_id}/media"
+    params = {
+        'is_carousel_item': 'true',
+        'access_token': access_token
+    }
+    
+    # Use appropriate parameter based on media type
+    if media_type == 'video':
+        params['video_url'] = media_url
+        params['media_type'] = 'REELS'
+    else:
+        params['image_url'] = media_url
+    
+    # Container creation is safe to repeat: an orphaned container simply expires
+    result = graph_request('POST', url, params=params, idempotent=True)
+    
+    if 'id' in result:
+        return result['id'], None
+    return None, result.get('error', result)
+
+def create_carousel_post(media_items, config, created_children=None):
+    """
+    Create a carousel post with multiple images/videos
+    
+    Every child is retried on its own with backoff (creation errors and failed
+    video processing alike), and children that were created successfully are
+    reused rather than created again. When items still fail, the
+    'carousel_failure_policy' setting decides: 'abort' (default) creates
+    nothing, 'drop' publishes the remaining items.
+    
+    Args:
+        media_items (list): (media_url, media_type, public_id) tuples
+        config (dict): Parsed post configuration
+        created_children (dict): item position -> child container ID, shared across
+            calls so a retried carousel reuses the children that already exist
+            (positions, not URLs, so an item listed twice gets two children)
+        
+    Returns:
+        str: Carousel container ID, or None
+    """
+    access_token = os.getenv('ACCESS_TOKEN')
+    account_id = os.getenv('ACCOUNT_ID')
+    
+    created = created_children if created_children is not None else {}
+    failure_policy = config.get('carousel_failure_policy') or 'abort'
+    max_attempts = config.get('carousel_child_attempts') or 3
+    retry_delay = 5  # seconds, doubled after every round
+    errors = {}
     
-    # Create media objects for each media item
-    for i, (media_url, media_type, public_id) in enumerate(media_items):
-        print(f"\n📸 Creating media {i+1}/{len(media_items)}...")
+    for attempt in range(max_attempts):
+        pending = [(i, item) for i, item in enumerate(media_items) if i not in created]
+        if not pending:
+            break
         
-        url = f"https://graph.facebook.com/v18.0/{account_id}/media"
-        params = {
-            'is_carousel_item': 'true',
-            'access_token': access_token
-        }
+        if attempt > 0:
+            print(f"\n🔁 Retrying {len(pending)} failed item(s) in {retry_delay}s (attempt {attempt + 1}/{max_attempts})...")
+            time.sleep(retry_delay)
+            retry_delay *= 2
         
-        # Use appropriate parameter based on media type
-        if media_type == 'video':
-            params['video_url'] = media_url
-            params['media_type'] = 'REELS'
-        else:
-            params['image_url'] = media_url
+        # Create media objects for each item that has no container yet
+        new_videos = {}
+        for i, (media_url, media_type, public_id) in pending:
+            print(f"\n📸 Creating media {i+1}/{len(media_items)}...")
+            container_id, error = create_carousel_item(media_url, media_type)
+            
+            if container_id:
+                created[i] = container_id
+                errors.pop(i, None)
+                if media_type == 'video':
+                    new_videos[container_id] = i
+                print(f"  ✅ Media created: {container_id}")
+            else:
+                errors[i] = error
+                print(f"  ❌ Failed to create media {i+1} ({public_id}): {error}")
         
-        response = requests.post(url, params=params)
-        result = response.json()
+        # Video children must finish processing before the carousel can be created;
+        # they are all checked together by the shared status service
+        if new_videos:
+            print(f"\n⏳ Waiting for {len(new_videos)} video item(s) to process...")
+            statuses = wait_for_containers(list(new_videos))
+            for container_id, status in statuses.items():
+                if status.get('status_code') != 'FINISHED':
+                    i = new_videos[container_id]
+                    # A container whose processing failed cannot be reused
+                    del created[i]
+                    errors[i] = f"video processing {status.get('status_code') or 'timed out'}: {status.get('status', '')}"
+                    print(f"  ❌ Video processing failed for media {i+1}: {errors[i]}")
+    
+    if errors:
+        print(f"\n📋 {len(errors)} of {len(media_items)} carousel item(s) failed:")
+        for i, error in sorted(errors.items()):
+            print(f"  - Item {i+1} ({media_items[i][2]}): {error}")
         
-        if 'id' in result:
-            media_ids.append(result['id'])
-            print(f"  ✅ Media created: {result['id']}")
-        else:
-            print(f"  ❌ Failed to create media: {result}")
+        if failure_policy != 'drop':
+            print("❌ Not creating the carousel (set 'carousel_failure_policy: drop' to publish the rest)")
             return None
+        if len(media_items) - len(errors) < 2:
+            print("❌ Fewer than 2 items left, a carousel cannot be created")
+            return None
+        print(f"⚠️ Dropping failed item(s) and continuing with {len(media_items) - len(errors)}")
+    
+    media_ids = [created[i] for i in range(len(media_items)) if i in created]
     
     # Create the carousel container
     print("\n🎠 Creating carousel container...")
@@ -219,8 +316,7 @@ def create_carousel_post(media_items, config):
     if config['user_tags']:
         container_params['user_tags'] = ','.join(config['user_tags'])
     
-    response = requests.post(container_url, params=container_params)
-    result = response.json()
+    result = graph_request('POST', container_url, params=container_params, idempotent=True)
     
     if 'id' in result:
         return result['id']
@@ -256,8 +352,7 @@ def create_single_post(media_url, media_type, config):
     if config['user_tags']:
         params['user_tags'] = ','.join(config['user_tags'])
     
-    response = requests.post(url, params=params)
-    result = response.json()
+    result = graph_request('POST', url, params=params, idempotent=True)
     
     if 'id' in result:
         return result['id']
@@ -267,7 +362,6 @@ def create_single_post(media_url, media_type, config):
 
 def publish_post(creation_id, config):
     """Publish the created media"""
-    import time
     access_token = os.getenv('ACCESS_TOKEN')
     account_id = os.getenv('ACCOUNT_ID')
     
@@ -284,8 +378,8 @@ def publish_post(creation_id, config):
     retry_delay = 10  # seconds
     
     for attempt in range(max_retries):
-        response = requests.post(publish_url, params=publish_params)
-        result = response.json()
+        # Publishing is not idempotent: only retried when Instagram answered with an error
+        result = graph_request('POST', publish_url, params=publish_params, idempotent=False)
         
         if 'id' in result:
             print(f"🎉 SUCCESS! Posted to Instagram!")
@@ -331,26 +425,25 @@ def cleanup_cloudinary_files(public_ids):
     
     print("🧹 Cloudinary cleanup completed")
 
-def main():
-    """Main function to post all images in media folder"""
-    media_folder = os.path.join(os.path.dirname(__file__), 'media')
-    yaml_file = os.path.join(os.path.dirname(__file__), 'post.yaml')
-    
-    print("=== Instagram Multi-Image Poster ===\n")
+def upload_folder(media_folder, config):
+    """
+    Validate a folder's media and configuration, then upload the media to Cloudinary
     
-    # Parse configuration
-    print("📋 Reading post configuration...")
-    config = parse_post_config(yaml_file)
-    print(f"  Caption: {config['caption'][:50]}..." if len(config['caption']) > 50 else f"  Caption: {config['caption']}")
-    print(f"  Hashtags: {config['hashtags']}")
-    
-    # Show additional metadata if present
-    if config['location']:
-        print(f"  📍 Location: {config['location']}")
-    if config['user_tags']:
-        print(f"  👥 User tags: {', '.join(config['user_tags'])}")
-    if config['scheduled_publish_time']:
-        print(f"  ⏰ Scheduled: {config['scheduled_publish_time']}")
+    Args:
+        media_folder (str): Folder containing the images/videos
+        config (dict): Parsed post configuration
+        
+    Returns:
+        dict: {'media_items', 'public_ids', 'uploaded_files'}, or None if validation or upload failed
+    """
+    # Validate tags and location before spending time on uploads
+    if config['user_tags'] or config['collaborators'] or config['location']:
+        problems = TagResolver().validate_config(config)
+        if problems:
+            print("\n❌ Post configuration has invalid tags:")
+            for problem in problems:
+                print(f"  - {problem}")
+            return None
     
     # Get media files
     media_files = get_media_files(media_folder)
@@ -358,53 +451,179 @@ def main():
     if not media_files:
         print(f"\n❌ No images found in {media_folder}")
         print("Please add JPG or PNG images to the media folder.")
-        return
+        return None
     
     print(f"\n📁 Found {len(media_files)} media file(s):")
     for file in media_files:
         print(f"  - {os.path.basename(file)}")
     
+    # Preflight: headers and caption only, so problems surface before any upload
+    with profile_stage('preflight'):
+        preflight = run_preflight(media_files, config)
+        for warning in preflight['warnings']:
+            print(f"  ⚠️ {warning}")
+        if preflight['errors']:
+            print("\n❌ Preflight check failed:")
+            for error in preflight['errors']:
+                print(f"  - {error}")
+            return None
+    
+    # Refuse to re-post media that is already live, even if it was re-encoded
+    with profile_stage('duplicate_check'):
+        if not config.get('allow_duplicates'):
+            duplicates = find_duplicates(media_files)
+            if duplicates:
+                print("\n❌ Some media has already been published:")
+                for file, match in duplicates.items():
+                    print(f"  - {os.path.basename(file)} matches media {match['media_id']} (distance {match['distance']})")
+                print("Set 'allow_duplicates: true' in post.yaml to post anyway.")
+                return None
+    
     # Upload all media files to Cloudinary and track their types
-    print("\n☁️ Uploading to Cloudinary...")
-    media_items = []
-    public_ids = []
-    for file in media_files:
-        url, public_id = upload_to_cloudinary(file)
-        if url and public_id:
-            # Determine media type based on file extension
-            media_type = 'video' if file.lower().endswith('.mp4') else 'image'
-            media_items.append((url, media_type, public_id))
-            public_ids.append(public_id)
+    # Videos with the moov box at the end are remuxed (no re-encode) so processing can start early
+    with profile_stage('faststart'):
+        prepared = [ensure_faststart(file) for file in media_files]
+    
+    with profile_stage('upload'):
+        print("\n☁️ Uploading to Cloudinary...")
+        media_items = []
+        public_ids = []
+        uploaded_files = []
+        # Files go up concurrently; the shared limiter sets how many at a time from measured throughput
+        limiter = get_upload_limiter()
+        try:
+            with ContextExecutor(max_workers=limiter.max_level) as executor:
+                results = list(executor.map(upload_to_cloudinary, [path for path, _ in prepared]))
+        finally:
+            for path, remuxed in prepared:
+                if remuxed:
+                    os.remove(path)
+        print(f"  📶 {limiter.summary()}")
+        for file, (url, public_id) in zip(media_files, results):
+            if url and public_id:
+                # Determine media type based on file extension
+                media_type = 'video' if file.lower().endswith('.mp4') else 'image'
+                media_items.append((url, media_type, public_id))
+                public_ids.append(public_id)
+                uploaded_files.append(file)
     
     if not media_items:
         print("\n❌ No media files were successfully uploaded")
-        return
+        return None
     
-    # Create Instagram post
-    creation_id = None
-    if len(media_items) > 1:
-        # Create carousel post
-        print(f"\n🎠 Creating carousel with {len(media_items)} media items...")
-        creation_id = create_carousel_post(media_items, config)
-    else:
-        # Create single post
-        media_url, media_type, public_id = media_items[0]
-        print(f"\n📷 Creating single {'video' if media_type == 'video' else 'image'} post...")
-        creation_id = create_single_post(media_url, media_type, config)
-    
-    # Publish the post
-    post_success = False
-    if creation_id:
-        published_id = publish_post(creation_id, config)
-        post_success = published_id is not None
-    else:
-        print("\n❌ Failed to create Instagram post")
+    return {'media_items': media_items, 'public_ids': public_ids, 'uploaded_files': uploaded_files}
+
+def stage_post(media_items, uploaded_files, config):
+    """
+    Create the post container and wait until Instagram has processed it
+    
+    Args:
+        media_items (list): (media_url, media_type, public_id) for every uploaded file
+        uploaded_files (list): Local files in the same order
+        config (dict): Parsed post configuration
+        
+    Returns:
+        str: Creation ID of the ready container, or None on failure
+    """
+    has_video = any(media_type == 'video' for _, media_type, _ in media_items)
+    
+    with profile_stage('create_container'):
+        if len(media_items) > 1:
+            # Create carousel post
+            print(f"\n🎠 Creating carousel with {len(media_items)} media items...")
+            creation_id = create_carousel_post(media_items, config)
+        else:
+            # Create single post
+            media_url, media_type, public_id = media_items[0]
+            print(f"\n📷 Creating single {'video' if media_type == 'video' else 'image'} post...")
+            creation_id = create_single_post(media_url, media_type, config)
+        
+        if creation_id and has_video:
+            print("\n⏳ Waiting for video processing...")
+            # A single video's processing time is predicted from its file; carousel children were waited for already
+            wait_for_video(creation_id, uploaded_files[0] if len(media_items) == 1 else None)
     
-    # Clean up Cloudinary files after successful posting
-    if post_success:
-        cleanup_cloudinary_files(public_ids)
-    else:
+    if not creation_id:
+        print("\n❌ Failed to create Instagram post")
+    return creation_id
+
+def finish_post(published_id, media_items, uploaded_files, public_ids):
+    """Record a published post and remove its Cloudinary copies; after a failure the copies are kept for a retry"""
+    if published_id is None:
         print("\n⚠️ Post was not successful, keeping files in Cloudinary for retry")
+        return
+    record_published(uploaded_files, published_id)
+    # A single video is published as a reel (media_type=REELS) and has the reels metrics
+    is_reel = len(media_items) == 1 and media_items[0][1] == 'video'
+    record_media(published_id, 'REELS' if is_reel else 'FEED')
+    cleanup_cloudinary_files(public_ids)
+
+def post_folder(media_folder, yaml_file=None, config=None):
+    """
+    Post every media file in a folder as a single post or carousel
+    
+    With a scheduled_publish_time this call blocks until the post is published;
+    the posting worker schedules such jobs without holding a slot instead.
+    
+    Args:
+        media_folder (str): Folder containing the images/videos
+        yaml_file (str): Post configuration (defaults to post.yaml inside the folder)
+        config (dict): Already parsed configuration, used instead of yaml_file
+        
+    Returns:
+        str: Published media ID, or None if posting failed
+    """
+    if config is None:
+        # Parse configuration
+        print("📋 Reading post configuration...")
+        config = parse_post_config(yaml_file or os.path.join(media_folder, 'post.yaml'))
+    
+    print(f"  Caption: {config['caption'][:50]}..." if len(config['caption']) > 50 else f"  Caption: {config['caption']}")
+    print(f"  Hashtags: {config['hashtags']}")
+    
+    # Show additional metadata if present
+    if config['location']:
+        print(f"  📍 Location: {config['location']}")
+    if config['user_tags']:
+        print(f"  👥 User tags: {', '.join(config['user_tags'])}")
+    if config['scheduled_publish_time']:
+        print(f"  ⏰ Scheduled: {config['scheduled_publish_time']}")
+    
+    try:
+        scheduled_time = parse_scheduled_time(config['scheduled_publish_time'])
+    except ValueError as e:
+        print(f"\n❌ {e}")
+        return None
+    if scheduled_time and scheduled_time <= datetime.now():
+        print("  ⚠️ Scheduled time has passed, posting now")
+    
+    uploaded = upload_folder(media_folder, config)
+    if not uploaded:
+        return None
+    
+    def stage_container():
+        return stage_post(uploaded['media_items'], uploaded['uploaded_files'], config)
+    
+    # Publish the post, at the scheduled time if there is one
+    with profile_stage('publish'):
+        if scheduled_time and scheduled_time > datetime.now():
+            published_id = publish_at(scheduled_time, stage_container, lambda cid: publish_post(cid, config))
+        else:
+            creation_id = stage_container()
+            published_id = publish_post(creation_id, config) if creation_id else None
+    
+    finish_post(published_id, uploaded['media_items'], uploaded['uploaded_files'], uploaded['public_ids'])
+    return published_id
+
+def main():
+    """Main function to post all images in media folder"""
+    media_folder = os.path.join(os.path.dirname(__file__), 'media')
+    yaml_file = os.path.join(os.path.dirname(__file__), 'post.yaml')
+    
+    print("=== Instagram Multi-Image Poster ===\n")
+    
+    post_folder(media_folder, yaml_file)
 
 if __name__ == "__main__":
+    enable_from_argv()
     main()
\ No newline at end of file
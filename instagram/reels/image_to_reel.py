@@ -1,6 +1,8 @@
 import os
+import argparse
 import subprocess
 from instagram_reels import InstagramReels
+from utils.profiling import enable_from_argv, profile_stage
 from dotenv import load_dotenv
 
 # Load .env from project root
@@ -25,6 +27,7 @@ def image_to_video(image_path, output_path, duration=5):
             '-t', str(duration),  # Duration
             '-pix_fmt', 'yuv420p',  # Pixel format for compatibility
             '-vf', 'scale=1080:1920',  # Instagram Reels aspect ratio (9:16)
+            '-movflags', '+faststart',  # moov box first, so processing can start before the whole file arrives
             output_path
         ]
         
@@ -44,6 +47,158 @@ def image_to_video(image_path, output_path, duration=5):
         print(f"❌ Error: {e}")
         return False
 
+def build_slideshow_command(image_paths, output_path, durations, transition=None,
+                            transition_duration=0.5, zoom=False, fps=30):
+    """
+    Build a single ffmpeg command that renders a slideshow in one encode pass
+    
+    Args:
+        image_paths (list): Ordered image paths
+        output_path (str): Path for the output video
+        durations (list): Seconds each image is shown
+        transition (str): None for hard cuts, or an xfade transition such as 'fade'
+        transition_duration (float): Length of each transition in seconds
+        zoom (bool): Slow pan/zoom (Ken Burns) on every image
+        fps (int): Output frame rate
+        
+    Returns:
+        list: ffmpeg arguments
+    """
+    cmd = ['ffmpeg', '-y']
+    filters = []
+    
+    for i, (image_path, duration) in enumerate(zip(image_paths, durations)):
+        frames = int(round(duration * fps))
+        if zoom:
+            # zoompan generates all frames from a single decoded image
+            cmd += ['-i', image_path]
+            filters.append(
+                f"[{i}:v]scale=2160:3840:force_original_aspect_ratio=increase,crop=2160:3840,"
+                f"zoompan=z='min(zoom+0.0008,1.15)':x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'"
+                f":d={frames}:s=1080x1920:fps={fps},setsar=1,format=yuv420p[v{i}]"
+            )
+        else:
+            cmd += ['-loop', '1', '-framerate', str(fps), '-t', str(duration), '-i', image_path]
+            filters.append(
+                f"[{i}:v]scale=1080:1920:force_original_aspect_ratio=decrease,"
+                f"pad=1080:1920:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p[v{i}]"
+            )
+    
+    if len(image_paths) == 1:
+        last = 'v0'
+    elif transition:
+        # Chain xfade filters; each one starts transition_duration before the running end
+        last = 'v0'
+        length = durations[0]
+        for i in range(1, len(image_paths)):
+            offset = length - transition_duration
+            label = f"x{i}"
+            filters.append(
+                f"[{last}][v{i}]xfade=transition={transition}:duration={transition_duration}:offset={offset:.3f}[{label}]"
+            )
+            last = label
+            length += durations[i] - transition_duration
+    else:
+        inputs = ''.join(f"[v{i}]" for i in range(len(image_paths)))
+        filters.append(f"{inputs}concat=n={len(image_paths)}:v=1:a=0[out]")
+        last = 'out'
+    
+    cmd += [
+        '-filter_complex', ';'.join(filters),
+        '-map', f"[{last}]",
+        '-c:v', 'libx264',
+        '-tune', 'stillimage',  # Tuned for static content: fewer bits on unchanging frames
+        '-preset', 'medium',
+        '-crf', '20',
+        '-r', str(fps),
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+        output_path
+    ]
+    return cmd
+
+def images_to_slideshow(image_paths, output_path, durations=3, transition='fade',
+                        transition_duration=0.5, zoom=False):
+    """
+    Render several images into one reel with a single ffmpeg filter graph and encode
+    
+    Args:
+        image_paths (list): Ordered image paths
+        output_path (str): Path for the output video
+        durations (int or list): Seconds per image, or one value per image
+        transition (str): xfade transition name (e.g. 'fade', 'slideleft'), None for hard cuts
+        transition_duration (float): Length of each transition in seconds
+        zoom (bool): Slow pan/zoom on every image
+    """
+    if not image_paths:
+        print("❌ No images given for the slideshow")
+        return False
+    
+    if isinstance(durations, (int, float)):
+        durations = [durations] * len(image_paths)
+    if len(durations) != len(image_paths):
+        print("❌ Need one duration per image")
+        return False
+    if transition and min(durations) <= transition_duration:
+        print("❌ Every image must be shown longer than the transition")
+        return False
+    
+    cmd = build_slideshow_command(image_paths, output_path, durations, transition, transition_duration, zoom)
+    
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        
+        if result.returncode == 0:
+            print(f"✅ Slideshow created: {output_path} ({len(image_paths)} images, one encode)")
+            return True
+        else:
+            print(f"❌ FFmpeg error: {result.stderr}")
+            return False
+            
+    except FileNotFoundError:
+        print("❌ FFmpeg not found. Install with: brew install ffmpeg")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+
+def post_slideshow_as_reel(image_paths, caption="", durations=3, transition='fade', zoom=False,
+                           video_path="slideshow_reel.mp4"):
+    """
+    Render images into a slideshow and post it as a Reel
+    
+    Args:
+        image_paths (list): Ordered image paths
+        caption (str): Caption for the reel
+        durations (int or list): Seconds per image, or one value per image
+        transition (str): xfade transition name, None for hard cuts
+        zoom (bool): Slow pan/zoom on every image
+        video_path (str): Where the slideshow is rendered (removed once posted)
+    """
+    missing = [path for path in image_paths if not os.path.exists(path)]
+    if missing:
+        print(f"❌ Images not found: {', '.join(missing)}")
+        return
+    
+    print(f"🎬 Rendering slideshow from {len(image_paths)} images...")
+    with profile_stage('render'):
+        rendered = images_to_slideshow(image_paths, video_path, durations, transition, zoom=zoom)
+    
+    if rendered:
+        print(f"📱 Posting to Instagram Reels...")
+        
+        reels = InstagramReels()
+        result = reels.post_reel(video_path, caption)
+        
+        if result.get('success'):
+            print(f"🎉 Reel posted successfully! Media ID: {result['media_id']}")
+            os.remove(video_path)
+            print(f"🗑️ Cleaned up temporary video file")
+        else:
+            print(f"❌ Failed to post: {result.get('error', 'Unknown error')}")
+    else:
+        print("❌ Failed to create slideshow")
+
 def post_image_as_reel(image_path, caption="", duration=5):
     """
     Convert image to video and post as Reel
@@ -62,7 +217,10 @@ def post_image_as_reel(image_path, caption="", duration=5):
     video_path = f"{base_name}_reel.mp4"
     
     print(f"🎬 Converting image to video...")
-    if image_to_video(image_path, video_path, duration):
+    with profile_stage('render'):
+        rendered = image_to_video(image_path, video_path, duration)
+    
+    if rendered:
         print(f"📱 Posting to Instagram Reels...")
         
         reels = InstagramReels()
@@ -79,7 +237,18 @@ def post_image_as_reel(image_path, caption="", duration=5):
         print("❌ Failed to create video from image")
 
 if __name__ == "__main__":
-    image_file = "Generated Image August 29, 2025 - 6_43PM.jpeg"
-    caption = "AI Generated Image - August 29, 2025"
+    enable_from_argv()
+    parser = argparse.ArgumentParser(description="Post images as an Instagram Reel slideshow")
+    parser.add_argument('images', nargs='*', help="Images in slideshow order")
+    parser.add_argument('-o', '--output', default="slideshow_reel.mp4", help="Path for the rendered video")
+    parser.add_argument('--caption', default="", help="Caption for the reel")
+    args = parser.parse_args()
     
-    post_image_as_reel(image_file, caption, duration=10)
\ No newline at end of file
+    if args.images:
+        # Slideshow mode: one or more images in order
+        post_slideshow_as_reel(args.images, args.caption, video_path=args.output)
+    else:
+        image_file = "Generated Image August 29, 2025 - 6_43PM.jpeg"
+        caption = "AI Generated Image - August 29, 2025"
+        
+        post_image_as_reel(image_file, caption, duration=10)
\ No newline at end of file
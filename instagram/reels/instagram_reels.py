@@ -1,11 +1,75 @@
 import os
+import sys
 import requests
-import time
+import subprocess
+import tempfile
+import cloudinary
+import cloudinary.uploader
 from dotenv import load_dotenv
 
 # Load .env from project root
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env'))
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.retry_policy import graph_request, retry_call, classify_graph_error, TRANSIENT, RATE_LIMITED
+from utils.cloudinary_upload import upload_media, upload_file
+from utils.media_index import find_duplicates, record_published
+from utils.insights import record_media
+from utils.upload_concurrency import get_upload_limiter
+from utils.processing_predictor import wait_for_video
+from utils.profiling import enable_from_argv, profile_stage
+from utils.priority import ContextExecutor
+from utils.faststart import ensure_faststart
+from utils.streaming_upload import MultipartFileStream
+from transcode import transcode_for_reels
+
+# Configure Cloudinary (used to host extracted cover frames)
+cloudinary.config(
+    cloud_name="dyemob08j",
+    api_key=os.getenv('CLOUDINARY_API'),
+    api_secret=os.getenv('CLOUDINARY_SECRET')
+)
+
+def extract_cover_frame(video_path, output_path, timestamp=None):
+    """
+    Extract a single JPEG cover frame from a video
+    
+    Args:
+        video_path (str): Local path or URL of the video
+        output_path (str): Path for the extracted JPEG
+        timestamp (float): Exact time in seconds for the frame. When omitted, the
+            first keyframe after one second is used, which only needs a keyframe
+            seek and no decoding of intermediate frames.
+        
+    Returns:
+        bool: True if the frame was written
+    """
+    if timestamp is None:
+        seek_args = ['-ss', '1', '-skip_frame', 'nokey']
+    else:
+        seek_args = ['-ss', str(timestamp)]
+    
+    try:
+        for args in (seek_args, ['-skip_frame', 'nokey']):
+            # Input seeking (-ss before -i) jumps straight to the nearest keyframe
+            cmd = ['ffmpeg', '-y'] + args + [
+                '-i', video_path,
+                '-frames:v', '1',
+                '-q:v', '2',  # High quality JPEG
+                output_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            
+            if result.returncode == 0 and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                return True
+            # Very short clips have nothing after the seek point; retry from the start
+        
+        print(f"❌ FFmpeg could not extract a cover frame: {result.stderr[-500:]}")
+        return False
+    except FileNotFoundError:
+        print("❌ FFmpeg not found. Install with: brew install ffmpeg")
+        return False
+
 class InstagramReels:
     def __init__(self):
         self.access_token = os.getenv('ACCESS_TOKEN') or os.getenv('GSC_ACCESS_TOKEN')
@@ -37,11 +101,8 @@ class InstagramReels:
         if cover_url:
             params['cover_url'] = cover_url
             
-        try:
-            response = requests.post(url, params=params)
-            return response.json()
-        except Exception as e:
-            return {'error': f'Upload failed: {str(e)}'}
+        # Container creation is safe to repeat: an orphaned container simply expires
+        return graph_request('POST', url, params=params, idempotent=True)
     
     def upload_local_video(self, video_path, caption="", share_to_feed=True):
         """
@@ -73,8 +134,7 @@ class InstagramReels:
         
         try:
             # Initialize upload
-            init_response = requests.post(init_url, data=init_data)
-            init_result = init_response.json()
+            init_result = graph_request('POST', init_url, data=init_data, idempotent=True)
             
             if 'error' in init_result:
                 return init_result
@@ -87,11 +147,16 @@ class InstagramReels:
             # Step 2: Upload the video file
             upload_url = f"https://graph.facebook.com/v18.0/{upload_id}"
             
-            with open(video_path, 'rb') as video_file:
-                files = {'source': video_file}
-                upload_response = requests.post(upload_url, files=files, data={'access_token': self.access_token})
+            # The transfer holds a slot of the shared upload limiter, which tunes concurrency to throughput
+            # The body is streamed from disk, so memory use does not grow with the video size
+            with get_upload_limiter().transfer(file_size) as transfer:
+                with MultipartFileStream({'access_token': self.access_token}, 'source', video_path) as body:
+                    upload_response = requests.post(upload_url, data=body, headers={'Content-Type': body.content_type})
+                result = upload_response.json()
+                if classify_graph_error(result, upload_response.status_code) in (TRANSIENT, RATE_LIMITED):
+                    transfer.congested = True
                 
-            return upload_response.json()
+            return result
             
         except Exception as e:
             return {'error': f'Upload failed: {str(e)}'}
@@ -113,11 +178,8 @@ class InstagramReels:
             'access_token': self.access_token
         }
         
-        try:
-            response = requests.post(url, params=params)
-            return response.json()
-        except Exception as e:
-            return {'error': f'Publish failed: {str(e)}'}
+        # Publishing is not idempotent: only retried when Instagram answered with an error
+        return graph_request('POST', url, params=params, idempotent=False)
     
     def check_upload_status(self, creation_id):
         """
@@ -136,13 +198,93 @@ class InstagramReels:
             'access_token': self.access_token
         }
         
+        # Status checks are idempotent, so a slow response is hedged with a second request
+        return graph_request('GET', url, params=params, hedge_after=5)
+    
+    def prepare_cover(self, video_path_or_url, timestamp=None):
+        """
+        Extract a cover frame from the video and host it on Cloudinary
+        
+        Args:
+            video_path_or_url (str): Local file path or URL to video
+            timestamp (float): Time of the cover frame in seconds (optional)
+            
+        Returns:
+            tuple: (cover_url, public_id), or (None, None) on failure
+        """
+        fd, cover_path = tempfile.mkstemp(suffix='_cover.jpg')
+        os.close(fd)
+        
         try:
-            response = requests.get(url, params=params)
-            return response.json()
+            if not extract_cover_frame(video_path_or_url, cover_path, timestamp):
+                return None, None
+            
+            upload_result = retry_call(upload_file, cover_path, os.path.getsize(cover_path), endpoint='cloudinary-upload')
+            print(f"🖼️ Cover frame uploaded: {upload_result['secure_url']}")
+            return upload_result['secure_url'], upload_result['public_id']
         except Exception as e:
-            return {'error': f'Status check failed: {str(e)}'}
+            print(f"⚠️ Cover upload failed: {e}")
+            return None, None
+        finally:
+            os.remove(cover_path)
+    
+    def upload_with_cover(self, video_path_or_url, caption="", cover_timestamp=None):
+        """
+        Create a reel container with an extracted cover frame
+        
+        For local files the video is hosted on Cloudinary so that the cover
+        extraction/upload and the video upload run at the same time; the cover
+        then adds no wall-clock time before container creation.
+        
+        Args:
+            video_path_or_url (str): Local file path or URL to video
+            caption (str): Caption for the reel
+            cover_timestamp (float): Time of the cover frame in seconds (optional)
+            
+        Returns:
+            tuple: (upload response dict, list of Cloudinary assets to clean up)
+        """
+        uploaded_assets = []
+        video_url = None
+        upload_error = None
+        
+        with ContextExecutor(max_workers=2) as executor:
+            cover_future = executor.submit(self.prepare_cover, video_path_or_url, cover_timestamp)
+            
+            if video_path_or_url.startswith(('http://', 'https://')):
+                video_url = video_path_or_url
+            else:
+                try:
+                    video_result = executor.submit(upload_media, video_path_or_url, resource_type="video", surface='reels').result()
+                    video_url = video_result['delivery_url']
+                    uploaded_assets.append((video_result['public_id'], 'video'))
+                except Exception as e:
+                    upload_error = {'error': f'Upload failed: {str(e)}'}
+            
+            cover_url, cover_public_id = cover_future.result()
+        
+        if cover_public_id:
+            uploaded_assets.append((cover_public_id, 'image'))
+        
+        if upload_error:
+            self.cleanup_assets(uploaded_assets)
+            return upload_error, []
+        
+        if not cover_url:
+            print("⚠️ Continuing without a custom cover")
+        
+        return self.upload_video(video_url, caption, cover_url=cover_url), uploaded_assets
     
-    def post_reel(self, video_path_or_url, caption="", wait_for_processing=True, max_wait_time=300):
+    def cleanup_assets(self, uploaded_assets):
+        """Remove temporary Cloudinary assets created for a reel"""
+        for public_id, resource_type in uploaded_assets:
+            try:
+                cloudinary.uploader.destroy(public_id, resource_type=resource_type)
+            except Exception as e:
+                print(f"⚠️ Could not delete {public_id}: {e}")
+    
+    def post_reel(self, video_path_or_url, caption="", wait_for_processing=True, max_wait_time=300,
+                  extract_cover=False, cover_timestamp=None, allow_duplicates=False, transcode=False):
         """
         Complete workflow to post a reel
         
@@ -151,66 +293,105 @@ class InstagramReels:
             caption (str): Caption for the reel
             wait_for_processing (bool): Whether to wait for video processing
             max_wait_time (int): Maximum time to wait for processing (seconds)
+            extract_cover (bool): Extract and upload a cover frame alongside the video
+            cover_timestamp (float): Time of the cover frame in seconds (implies extract_cover)
+            allow_duplicates (bool): Post local videos that match already published media
+            transcode (bool): Re-encode local videos to the Reels profile (1080x1920 H.264/AAC)
+                before upload, with segments encoded in parallel
             
         Returns:
             dict: Final result with media_id or error
         """
         print(f"🎬 Starting Reel upload...")
         
+        is_local = not video_path_or_url.startswith(('http://', 'https://'))
+        if is_local and not allow_duplicates:
+            match = find_duplicates([video_path_or_url]).get(video_path_or_url)
+            if match:
+                print(f"❌ Already published as media {match['media_id']} (distance {match['distance']})")
+                return {'error': f"Duplicate of published media {match['media_id']}"}
+        
+        uploaded_assets = []
+        
+        # Local files with the moov box at the end are remuxed so Instagram can start processing early
+        upload_path, temporary = video_path_or_url, False
+        if is_local and transcode:
+            # The transcoded file is written in faststart layout
+            fd, upload_path = tempfile.mkstemp(suffix='_reel.mp4')
+            os.close(fd)
+            with profile_stage('transcode'):
+                transcoded = transcode_for_reels(video_path_or_url, upload_path)
+            if not transcoded['success']:
+                os.remove(upload_path)
+                print(f"❌ Transcode failed: {transcoded['error']}")
+                return {'error': f"Transcode failed: {transcoded['error']}"}
+            temporary = True
+        elif is_local:
+            with profile_stage('faststart'):
+                upload_path, temporary = ensure_faststart(video_path_or_url)
+        
         # Upload video
-        if video_path_or_url.startswith(('http://', 'https://')):
-            upload_result = self.upload_video(video_path_or_url, caption)
-        else:
-            upload_result = self.upload_local_video(video_path_or_url, caption)
+        with profile_stage('upload'):
+            try:
+                if extract_cover or cover_timestamp is not None:
+                    upload_result, uploaded_assets = self.upload_with_cover(upload_path, caption, cover_timestamp)
+                elif not is_local:
+                    upload_result = self.upload_video(upload_path, caption)
+                else:
+                    upload_result = self.upload_local_video(upload_path, caption)
+            finally:
+                if temporary:
+                    os.remove(upload_path)
+            if is_local:
+                print(f"📶 {get_upload_limiter().summary()}")
         
-        if 'error' in upload_result:
-            print(f"❌ Upload failed: {upload_result['error']}")
-            return upload_result
+        # Hosted videos and covers are only needed until Instagram has fetched them,
+        # so they are removed whatever the outcome
+        try:
+            if 'error' in upload_result:
+                print(f"❌ Upload failed: {upload_result['error']}")
+                return upload_result
             
-        if 'id' not in upload_result:
-            print(f"❌ Upload failed: {upload_result}")
-            return {'error': 'No creation_id in response'}
+            if 'id' not in upload_result:
+                print(f"❌ Upload failed: {upload_result}")
+                return {'error': 'No creation_id in response'}
             
-        creation_id = upload_result['id']
-        print(f"✅ Video uploaded! Creation ID: {creation_id}")
+            creation_id = upload_result['id']
+            print(f"✅ Video uploaded! Creation ID: {creation_id}")
         
-        # Wait for processing if requested
-        if wait_for_processing:
-            print("⏳ Waiting for video processing...")
-            start_time = time.time()
+            # Wait for processing if requested
+            with profile_stage('processing'):
+                if wait_for_processing:
+                    print("⏳ Waiting for video processing...")
+                    # First check near the time predicted from past reels of similar size, length and resolution
+                    status = wait_for_video(creation_id, video_path_or_url if is_local else None, max_wait_time)
+                    status_code = status.get('status_code')
+                    print(f"📊 Status: {status.get('status', 'Unknown')} (Code: {status_code})")
             
-            while time.time() - start_time < max_wait_time:
-                status = self.check_upload_status(creation_id)
-                
-                if 'error' in status:
-                    print(f"❌ Status check failed: {status['error']}")
-                    break
-                    
-                status_code = status.get('status_code')
-                print(f"📊 Status: {status.get('status', 'Unknown')} (Code: {status_code})")
-                
-                if status_code == 'FINISHED':
-                    break
-                elif status_code == 'ERROR':
-                    return {'error': 'Video processing failed'}
-                    
-                time.sleep(10)  # Wait 10 seconds before checking again
-        
-        # Publish the media
-        print("📤 Publishing Reel...")
-        publish_result = self.publish_media(creation_id)
-        
-        if 'error' in publish_result:
-            print(f"❌ Publish failed: {publish_result['error']}")
-            return publish_result
-            
-        if 'id' in publish_result:
-            media_id = publish_result['id']
-            print(f"🎉 Reel posted successfully! Media ID: {media_id}")
-            return {'success': True, 'media_id': media_id, 'creation_id': creation_id}
-        else:
-            print(f"❌ Publish failed: {publish_result}")
-            return {'error': 'Failed to get media_id from publish response'}
+                    if status_code in ('ERROR', 'EXPIRED'):
+                        return {'error': 'Video processing failed'}
+        
+            # Publish the media
+            with profile_stage('publish'):
+                print("📤 Publishing Reel...")
+                publish_result = self.publish_media(creation_id)
+        
+            if 'error' in publish_result:
+                print(f"❌ Publish failed: {publish_result['error']}")
+                return publish_result
+            
+            if 'id' in publish_result:
+                media_id = publish_result['id']
+                print(f"🎉 Reel posted successfully! Media ID: {media_id}")
+                record_media(media_id, 'REELS')
+                if is_local:
+                    record_published([video_path_or_url], media_id)
+                return {'success': True, 'media_id': media_id, 'creation_id': creation_id}
+            else:
+                print(f"❌ Publish failed: {publish_result}")
+                return {'error': 'Failed to get media_id from publish response'}
+        finally:
+            self.cleanup_assets(uploaded_assets)
 
 def main():
     """Example usage"""
@@ -219,12 +400,25 @@ def main():
     # Test with a sample video URL or local file
     video_path = input("Enter video file path or URL: ").strip()
     caption = input("Enter caption (optional): ").strip()
+    cover = input("Cover frame time in seconds ('auto' for first keyframe, blank to skip): ").strip()
+    transcode = input("Transcode to the Reels profile first? (y/N): ").strip().lower() == 'y'
     
     if not video_path:
         print("❌ No video path provided")
         return
-        
-    result = reels.post_reel(video_path, caption)
+    
+    cover_timestamp = None
+    if cover and cover != 'auto':
+        try:
+            cover_timestamp = float(cover.replace(',', '.'))
+        except ValueError:
+            print(f"❌ Invalid cover time '{cover}': use seconds like 1.5, 'auto' or leave blank")
+            return
+        if cover_timestamp < 0:
+            print("❌ Cover time can't be negative")
+            return
+    result = reels.post_reel(video_path, caption, extract_cover=bool(cover), cover_timestamp=cover_timestamp,
+                             transcode=transcode)
     
     if result.get('success'):
         print(f"✅ Success! Your Reel is live: Media ID {result['media_id']}")
@@ -232,4 +426,5 @@ def main():
         print(f"❌ Failed: {result.get('error', 'Unknown error')}")
 
 if __name__ == "__main__":
+    enable_from_argv()
     main()
\ No newline at end of file
@@ -0,0 +1,190 @@
+import os
+import sys
+import argparse
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.preflight import read_mp4_info
+
+# Instagram Reels profile: 1080x1920 H.264 High, 30 fps, yuv420p, AAC audio
+REELS_FILTER = "scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2,setsar=1"
+REELS_VIDEO_ARGS = [
+    '-c:v', 'libx264',
+    '-profile:v', 'high',
+    '-preset', 'medium',
+    '-crf', '21',
+    '-r', '30',
+    '-g', '60',
+    '-pix_fmt', 'yuv420p',
+]
+REELS_AUDIO_ARGS = ['-c:a', 'aac', '-b:a', '128k', '-ar', '44100']
+
+def run_ffmpeg(cmd):
+    """Run an ffmpeg command and return (success, seconds, stderr)"""
+    started = time.time()
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.returncode == 0, time.time() - started, result.stderr
+
+def transcode_single(input_path, output_path):
+    """Transcode with a single ffmpeg process"""
+    cmd = ['ffmpeg', '-y', '-i', input_path, '-vf', REELS_FILTER] + REELS_VIDEO_ARGS + REELS_AUDIO_ARGS + [
+        '-movflags', '+faststart', output_path
+    ]
+    return run_ffmpeg(cmd)
+
+def transcode_for_reels(input_path, output_path, workers=None, min_parallel_duration=30, compare=False):
+    """
+    Transcode a video to the Reels profile, encoding keyframe-aligned segments in parallel
+
+    The video stream is split at keyframes without re-encoding, every segment is
+    encoded by its own ffmpeg process, the audio is encoded once alongside them,
+    and the pieces are joined with the concat demuxer (stream copy, no quality loss).
+    Short clips, where splitting only adds overhead, use a single process.
+
+    Args:
+        input_path (str): Source video
+        output_path (str): Path for the compliant MP4
+        workers (int): Parallel encoders (defaults to the number of CPU cores)
+        min_parallel_duration (float): Clips shorter than this (seconds) use a single process
+        compare (bool): After a segmented transcode, also time a single-process
+            transcode of the same input to check the reported speedup
+
+    Returns:
+        dict: 'success', 'mode', 'wall_time' and 'error' on failure. Segmented runs add
+              'speedup' (segment encode times summed over all encoders divided by the
+              wall time of the whole run, split and concat included) and
+              'encode_concurrency' (the same sum over the wall time of the parallel
+              stage only); with compare, 'single_wall_time' and 'measured_speedup'
+              (single-process wall time divided by segmented wall time)
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.time()
+
+    try:
+        info = read_mp4_info(input_path)
+    except (OSError, struct.error, IndexError):
+        # Unreadable header: fall back to a single pass
+        info = None
+    duration = info['duration'] if info else None
+
+    try:
+        if workers < 2 or not duration or duration < min_parallel_duration:
+            print(f"🎞️ Transcoding {os.path.basename(input_path)} in a single pass...")
+            ok, elapsed, stderr = transcode_single(input_path, output_path)
+            if not ok:
+                return {'success': False, 'mode': 'single', 'error': stderr[-1000:]}
+            print(f"✅ Transcoded in {elapsed:.1f}s")
+            return {'success': True, 'mode': 'single', 'wall_time': elapsed}
+
+        work_dir = tempfile.mkdtemp(prefix='reel_segments_')
+        try:
+            result = transcode_segmented(input_path, output_path, duration, workers, work_dir, started)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        if compare and result['success']:
+            result.update(compare_with_single(input_path, result['wall_time']))
+        return result
+    except FileNotFoundError:
+        print("❌ FFmpeg not found. Install with: brew install ffmpeg")
+        return {'success': False, 'error': 'ffmpeg not found'}
+
+def compare_with_single(input_path, segmented_wall_time):
+    """Time a single-process transcode of the same input (to a throwaway file) for the achieved speedup"""
+    fd, single_path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    try:
+        print("⏱️ Timing a single-process transcode for comparison...")
+        ok, elapsed, _ = transcode_single(input_path, single_path)
+    finally:
+        os.remove(single_path)
+    if not ok:
+        print("⚠️ Single-process transcode failed, speedup not measured")
+        return {}
+
+    speedup = elapsed / segmented_wall_time
+    print(f"📈 Single process: {elapsed:.1f}s, segmented: {segmented_wall_time:.1f}s ({speedup:.2f}x measured speedup)")
+    return {'single_wall_time': elapsed, 'measured_speedup': speedup}
+
+def transcode_segmented(input_path, output_path, duration, workers, work_dir, started):
+    """Split, encode segments in parallel and concatenate (see transcode_for_reels)"""
+    # Aim for about one segment per worker, but not shorter than 5 seconds
+    segment_time = max(5, int(duration / workers + 0.999))
+
+    print(f"✂️ Splitting {duration:.0f}s video into ~{segment_time}s keyframe-aligned segments...")
+    split_cmd = [
+        'ffmpeg', '-y', '-i', input_path,
+        '-map', '0:v:0', '-c', 'copy',
+        '-f', 'segment', '-segment_time', str(segment_time), '-reset_timestamps', '1',
+        os.path.join(work_dir, 'source_%03d.mp4')
+    ]
+    ok, _, stderr = run_ffmpeg(split_cmd)
+    if not ok:
+        return {'success': False, 'mode': 'segmented', 'error': stderr[-1000:]}
+
+    sources = sorted(name for name in os.listdir(work_dir) if name.startswith('source_'))
+    threads_per_encoder = max(1, (os.cpu_count() or 1) // min(workers, len(sources)))
+
+    jobs = []
+    for name in sources:
+        encoded = os.path.join(work_dir, name.replace('source_', 'encoded_'))
+        cmd = ['ffmpeg', '-y', '-i', os.path.join(work_dir, name), '-an', '-vf', REELS_FILTER] + \
+            REELS_VIDEO_ARGS + ['-threads', str(threads_per_encoder), encoded]
+        jobs.append((cmd, encoded))
+
+    audio_path = os.path.join(work_dir, 'audio.m4a')
+    audio_cmd = ['ffmpeg', '-y', '-i', input_path, '-vn'] + REELS_AUDIO_ARGS + [audio_path]
+
+    print(f"⚙️ Encoding {len(jobs)} segments with {workers} parallel encoders...")
+    encode_started = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        audio_future = executor.submit(run_ffmpeg, audio_cmd)
+        results = list(executor.map(run_ffmpeg, [cmd for cmd, _ in jobs]))
+        audio_ok, _, _ = audio_future.result()
+    encode_wall = time.time() - encode_started
+
+    for ok, _, stderr in results:
+        if not ok:
+            return {'success': False, 'mode': 'segmented', 'error': stderr[-1000:]}
+
+    list_path = os.path.join(work_dir, 'segments.txt')
+    with open(list_path, 'w') as f:
+        for _, encoded in jobs:
+            f.write(f"file '{encoded}'\n")
+
+    concat_cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path]
+    if audio_ok:
+        # Sources without an audio track simply produce no audio file
+        concat_cmd += ['-i', audio_path, '-map', '0:v', '-map', '1:a']
+    concat_cmd += ['-c', 'copy', '-movflags', '+faststart', output_path]
+    ok, _, stderr = run_ffmpeg(concat_cmd)
+    if not ok:
+        return {'success': False, 'mode': 'segmented', 'error': stderr[-1000:]}
+
+    # Encoding the segments one after another would take about their summed encode time
+    encoder_time = sum(elapsed for _, elapsed, _ in results)
+    encode_concurrency = encoder_time / encode_wall if encode_wall else 1.0
+    wall_time = time.time() - started
+    speedup = encoder_time / wall_time if wall_time else 1.0
+    print(f"✅ Transcoded in {wall_time:.1f}s ({len(jobs)} segments, {encoder_time:.1f}s of encoding, "
+          f"{speedup:.2f}x speedup, {encode_concurrency:.1f} encoders busy on average)")
+
+    return {'success': True, 'mode': 'segmented', 'segments': len(jobs), 'wall_time': wall_time,
+            'speedup': speedup, 'encode_concurrency': encode_concurrency}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode a video to the Instagram Reels profile")
+    parser.add_argument('input', help="Source video")
+    parser.add_argument('output', help="Path for the compliant MP4")
+    parser.add_argument('workers', nargs='?', type=int, help="Parallel encoders (default: CPU cores)")
+    parser.add_argument('--compare', action='store_true',
+                        help="Also time a single-process transcode to check the reported speedup")
+    args = parser.parse_args()
+
+    result = transcode_for_reels(args.input, args.output, args.workers, compare=args.compare)
+    sys.exit(0 if result['success'] else 1)
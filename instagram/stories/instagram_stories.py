@@ -1,5 +1,5 @@
 import os
-import requests
+import sys
 import cloudinary
 import cloudinary.uploader
 from dotenv import load_dotenv
@@ -7,6 +7,15 @@ from dotenv import load_dotenv
 # Load .env from project root
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env'))
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.retry_policy import graph_request
+from utils.cloudinary_upload import upload_media
+from utils.media_index import find_duplicates, record_published
+from utils.insights import record_media
+from utils.container_status import wait_for_container
+from utils.profiling import enable_from_argv, profile_stage
+from utils.priority import ContextExecutor, lane
+
 # Configure Cloudinary
 cloudinary.config(
     cloud_name="dyemob08j",
@@ -14,18 +23,30 @@ cloudinary.config(
     api_secret=os.getenv('CLOUDINARY_SECRET')
 )
 
-def upload_and_post_story(image_path):
-    """Upload image to Cloudinary and post to Instagram Stories"""
+# Public sample used when no video URL is given (must be MP4, max 15 seconds for stories)
+SAMPLE_VIDEO_URL = "https://sample-videos.com/video321/mp4/720/big_buck_bunny_720p_1mb.mp4"
+
+STORY_IMAGE_FORMATS = ('.jpg', '.jpeg', '.png')
+STORY_VIDEO_FORMATS = ('.mp4', '.mov')
+
+def upload_and_post_story(image_path, allow_duplicates=False):
+    """Upload image to Cloudinary and post to Instagram Stories (in the caller's priority lane, see utils.priority.lane)"""
     
     if not os.path.exists(image_path):
         print(f"❌ Image not found: {image_path}")
         return
     
+    if not allow_duplicates:
+        match = find_duplicates([image_path]).get(image_path)
+        if match:
+            print(f"❌ Already published as media {match['media_id']} (distance {match['distance']})")
+            return None
+    
     # Step 1: Upload to Cloudinary
     print(f"☁️ Uploading to Cloudinary: {image_path}")
     try:
-        upload_result = cloudinary.uploader.upload(image_path)
-        image_url = upload_result['secure_url']
+        upload_result = upload_media(image_path, surface='stories')
+        image_url = upload_result['delivery_url']
         print(f"✅ Uploaded! URL: {image_url}")
     except Exception as e:
         print(f"❌ Cloudinary upload failed: {e}")
@@ -47,8 +68,7 @@ def upload_and_post_story(image_path):
     }
     
     print("📤 Creating story...")
-    response = requests.post(url, params=params)
-    result = response.json()
+    result = graph_request('POST', url, params=params, idempotent=True)
     
     print(f"Response: {result}")
     
@@ -64,14 +84,16 @@ def upload_and_post_story(image_path):
         }
         
         print("📱 Publishing story...")
-        pub_response = requests.post(publish_url, params=publish_params)
-        pub_result = pub_response.json()
+        # Publishing is not idempotent: only retried when Instagram answered with an error
+        pub_result = graph_request('POST', publish_url, params=publish_params, idempotent=False)
         
         print(f"Publish result: {pub_result}")
         
         if 'id' in pub_result:
             print(f"🎉 Story posted! Media ID: {pub_result['id']}")
             print(f"🔗 Image hosted at: {image_url}")
+            record_published([image_path], pub_result['id'])
+            record_media(pub_result['id'], 'STORY')
             return pub_result['id']
         else:
             print(f"❌ Publish failed: {pub_result}")
@@ -80,8 +102,8 @@ def upload_and_post_story(image_path):
         print(f"❌ Creation failed: {result}")
         return None
 
-def post_video_to_stories():
-    """Post video to Instagram Stories"""
+def post_video_to_stories(video_url=SAMPLE_VIDEO_URL):
+    """Post video to Instagram Stories (in the caller's priority lane, see utils.priority.lane)"""
     access_token = os.getenv('ACCESS_TOKEN')
     account_id = os.getenv('ACCOUNT_ID')
     
@@ -90,9 +112,6 @@ def post_video_to_stories():
     # Create media object for video stories
     url = f"https://graph.facebook.com/v18.0/{account_id}/media"
     
-    # Use a public video URL for testing (must be MP4, max 15 seconds for stories)
-    video_url = "https://sample-videos.com/video321/mp4/720/big_buck_bunny_720p_1mb.mp4"
-    
     params = {
         'video_url': video_url,
         'media_type': 'STORIES',
@@ -100,8 +119,7 @@ def post_video_to_stories():
     }
     
     print("📤 Creating video story...")
-    response = requests.post(url, params=params)
-    result = response.json()
+    result = graph_request('POST', url, params=params, idempotent=True)
     
     print(f"Response: {result}")
     
@@ -110,31 +128,14 @@ def post_video_to_stories():
         print(f"✅ Created! ID: {creation_id}")
         
         # Check status (videos need processing)
-        status_url = f"https://graph.facebook.com/v18.0/{creation_id}"
-        status_params = {
-            'fields': 'status_code',
-            'access_token': access_token
-        }
+        print("⏳ Waiting for video processing...")
+        status_result = wait_for_container(creation_id, timeout=60)
         
-        import time
-        max_attempts = 30
-        attempt = 0
-        
-        while attempt < max_attempts:
-            print(f"⏳ Checking status (attempt {attempt + 1}/{max_attempts})...")
-            status_response = requests.get(status_url, params=status_params)
-            status_result = status_response.json()
-            
-            if 'status_code' in status_result:
-                if status_result['status_code'] == 'FINISHED':
-                    print("✅ Video processing complete!")
-                    break
-                elif status_result['status_code'] == 'ERROR':
-                    print(f"❌ Video processing error: {status_result}")
-                    return None
-            
-            time.sleep(2)
-            attempt += 1
+        if status_result.get('status_code') == 'FINISHED':
+            print("✅ Video processing complete!")
+        elif status_result.get('status_code') in ('ERROR', 'EXPIRED'):
+            print(f"❌ Video processing error: {status_result}")
+            return None
         
         # Publish the story
         publish_url = f"https://graph.facebook.com/v18.0/{account_id}/media_publish"
@@ -144,13 +145,14 @@ def post_video_to_stories():
         }
         
         print("📱 Publishing video story...")
-        pub_response = requests.post(publish_url, params=publish_params)
-        pub_result = pub_response.json()
+        # Publishing is not idempotent: only retried when Instagram answered with an error
+        pub_result = graph_request('POST', publish_url, params=publish_params, idempotent=False)
         
         print(f"Publish result: {pub_result}")
         
         if 'id' in pub_result:
             print(f"🎉 Video story posted! Media ID: {pub_result['id']}")
+            record_media(pub_result['id'], 'STORY')
             return pub_result['id']
         else:
             print(f"❌ Publish failed: {pub_result}")
@@ -159,7 +161,171 @@ def post_video_to_stories():
         print(f"❌ Creation failed: {result}")
         return None
 
+def get_story_files(source):
+    """Resolve a folder or an ordered list of paths into story media files"""
+    if isinstance(source, str) and os.path.isdir(source):
+        # Folders are posted in alphabetical order, like feed posts
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+    elif isinstance(source, str):
+        paths = [source]
+    else:
+        paths = list(source)
+    
+    return [path for path in paths if path.lower().endswith(STORY_IMAGE_FORMATS + STORY_VIDEO_FORMATS)]
+
+def wait_for_story_container(creation_id, timeout=60):
+    """Wait until Instagram finishes processing a story container"""
+    # Shared status service: all pending frames are checked in one request per interval
+    status_result = wait_for_container(creation_id, timeout)
+    status_code = status_result.get('status_code')
+    
+    if status_code == 'FINISHED':
+        return True
+    elif status_code is None:
+        print(f"  ❌ Container {creation_id} was not ready after {timeout} seconds")
+    else:
+        print(f"  ❌ Video processing error for {creation_id}: {status_result}")
+    return False
+
+def prepare_story(media_path):
+    """
+    Upload one story frame and create its container, waiting for video processing
+    
+    Args:
+        media_path (str): Path to a local image or video
+        
+    Returns:
+        dict: 'creation_id' on success, 'error' otherwise
+    """
+    name = os.path.basename(media_path)
+    is_video = media_path.lower().endswith(STORY_VIDEO_FORMATS)
+    
+    try:
+        if is_video:
+            upload_result = upload_media(media_path, resource_type="video", surface='stories')
+        else:
+            upload_result = upload_media(media_path, surface='stories')
+    except Exception as e:
+        return {'path': media_path, 'error': f'Cloudinary upload failed: {e}'}
+    
+    print(f"  ☁️ Uploaded: {name}")
+    
+    access_token = os.getenv('ACCESS_TOKEN')
+    account_id = os.getenv('ACCOUNT_ID')
+    url = f"https://graph.facebook.com/v18.0/{account_id}/media"
+    params = {
+        'media_type': 'STORIES',
+        'access_token': access_token
+    }
+    if is_video:
+        params['video_url'] = upload_result['delivery_url']
+    else:
+        params['image_url'] = upload_result['delivery_url']
+    
+    result = graph_request('POST', url, params=params, idempotent=True)
+    
+    if 'id' not in result:
+        return {'path': media_path, 'error': f'Container creation failed: {result}'}
+    
+    creation_id = result['id']
+    print(f"  ✅ Container created for {name}: {creation_id}")
+    
+    # Videos need processing before they can be published
+    if is_video and not wait_for_story_container(creation_id):
+        return {'path': media_path, 'error': 'Video processing did not finish'}
+    
+    return {'path': media_path, 'creation_id': creation_id}
+
+def publish_story(creation_id):
+    """Publish a prepared story container"""
+    access_token = os.getenv('ACCESS_TOKEN')
+    account_id = os.getenv('ACCOUNT_ID')
+    
+    publish_url = f"https://graph.facebook.com/v18.0/{account_id}/media_publish"
+    publish_params = {
+        'creation_id': creation_id,
+        'access_token': access_token
+    }
+    
+    pub_result = graph_request('POST', publish_url, params=publish_params, idempotent=False)
+    return pub_result.get('id'), pub_result
+
+def post_story_batch(source, max_workers=5, allow_duplicates=False):
+    """
+    Post a sequence of story frames from a folder or an ordered list of files
+    
+    Uploads, container creation and video processing run concurrently for all
+    frames; publishing happens strictly in order, each frame as soon as it and
+    every frame before it are ready.
+    
+    Args:
+        source (str or list): Folder path, single file path or ordered list of paths
+        max_workers (int): Number of frames prepared at the same time
+        allow_duplicates (bool): Post frames that match already published media
+        
+    Returns:
+        list: Media IDs of the published stories, in posting order
+    """
+    media_files = get_story_files(source)
+    
+    if not media_files:
+        print(f"❌ No story media found in {source}")
+        return []
+    
+    if not allow_duplicates:
+        duplicates = find_duplicates(media_files)
+        for path, match in duplicates.items():
+            print(f"⏭️ Skipping {os.path.basename(path)}: already published as media {match['media_id']}")
+        media_files = [path for path in media_files if path not in duplicates]
+        if not media_files:
+            print("❌ Every frame has already been published")
+            return []
+    
+    print(f"📁 Preparing {len(media_files)} story frame(s)...")
+    
+    published_ids = []
+    failed = []
+    
+    with ContextExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(prepare_story, path) for path in media_files]
+        
+        # Publish in the intended order as soon as each frame is ready
+        for index, future in enumerate(futures):
+            prepared = future.result()
+            name = os.path.basename(prepared['path'])
+            
+            if 'error' in prepared:
+                print(f"❌ Skipping frame {index + 1} ({name}): {prepared['error']}")
+                failed.append(prepared)
+                continue
+            
+            media_id, pub_result = publish_story(prepared['creation_id'])
+            if media_id:
+                print(f"📱 Frame {index + 1}/{len(media_files)} published: {media_id}")
+                published_ids.append(media_id)
+                record_published([prepared['path']], media_id)
+                record_media(media_id, 'STORY')
+            else:
+                print(f"❌ Publish failed for frame {index + 1} ({name}): {pub_result}")
+                failed.append({'path': prepared['path'], 'error': pub_result})
+    
+    print(f"\n🎉 Published {len(published_ids)}/{len(media_files)} story frame(s)")
+    if failed:
+        print(f"⚠️ {len(failed)} frame(s) failed: {', '.join(os.path.basename(f['path']) for f in failed)}")
+    
+    return published_ids
+
 if __name__ == "__main__":
-    # Post the specified image to Instagram Stories
-    image_file = "Arafat_Jasser_Ahmad_Amer.jpg"
-    upload_and_post_story(image_file)
\ No newline at end of file
+    enable_from_argv()
+    # Stories posted by hand are live coverage; the posting worker picks the lane from the job
+    with lane('live'):
+        if len(sys.argv) > 1:
+            # Batch mode: a folder or an ordered list of images/videos
+            source = sys.argv[1] if len(sys.argv) == 2 else sys.argv[1:]
+            with profile_stage('story_batch'):
+                post_story_batch(source)
+        else:
+            # Post the specified image to Instagram Stories
+            image_file = "Arafat_Jasser_Ahmad_Amer.jpg"
+            with profile_stage('story'):
+                upload_and_post_story(image_file)
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import time
+import uuid
+import threading
+
+import cloudinary
+import cloudinary.exceptions
+import cloudinary.utils
+
+from utils.retry_policy import (retry_call, session, default_policy, classify_exception,
+                                CircuitBreaker, CircuitOpenError, FATAL)
+from utils.upload_concurrency import get_upload_limiter
+from utils.priority import ContextExecutor
+from utils.streaming_upload import MultipartFileStream
+
+# Cloudinary requires chunks of at least 5 MB (except the last one)
+MIN_CHUNK_SIZE = 5 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = int(os.getenv('CLOUDINARY_CHUNK_SIZE', 20 * 1024 * 1024))
+# Files at or above this size are sent in chunks
+LARGE_FILE_THRESHOLD = int(os.getenv('CLOUDINARY_LARGE_FILE_THRESHOLD', 40 * 1024 * 1024))
+
+# Delivery variants handed to Instagram: capped to what each surface displays,
+# quality tuned by Cloudinary and in formats Instagram accepts (JPEG, H.264/AAC MP4)
+IMAGE_DELIVERY = {
+    'feed': {'crop': 'limit', 'width': 1440, 'height': 1800, 'quality': 'auto:good', 'format': 'jpg'},
+    'stories': {'crop': 'limit', 'width': 1080, 'height': 1920, 'quality': 'auto:good', 'format': 'jpg'},
+}
+VIDEO_DELIVERY = {
+    'crop': 'limit', 'width': 1080, 'height': 1920, 'quality': 'auto:good',
+    'video_codec': 'h264', 'audio_codec': 'aac', 'format': 'mp4'
+}
+# Cloudinary only derives videos up to this size synchronously during upload
+SYNC_EAGER_VIDEO_LIMIT = 100 * 1024 * 1024
+
+def raise_for_cloudinary_error(response):
+    """Turn a failed upload response into the SDK's exception types so the retry policy can classify it"""
+    try:
+        result = response.json()
+    except ValueError:
+        result = {}
+
+    if response.status_code < 400 and 'error' not in result:
+        return result
+
+    message = result.get('error', {}).get('message', f'HTTP {response.status_code}')
+    if response.status_code in (420, 429):
+        raise cloudinary.exceptions.RateLimited(message)
+    if response.status_code >= 500:
+        raise cloudinary.exceptions.GeneralError(message)
+    if response.status_code == 401:
+        raise cloudinary.exceptions.AuthorizationRequired(message)
+    raise cloudinary.exceptions.BadRequest(message)
+
+def signed_upload(resource_type, **options):
+    """Upload URL and signed parameters for a direct upload API request"""
+    params = cloudinary.utils.build_upload_params(**options)
+    params['timestamp'] = int(time.time())
+    params = cloudinary.utils.sign_request(params, {})
+    return cloudinary.utils.cloudinary_api_url('upload', resource_type=resource_type), params
+
+def upload_large_parallel(file_path, resource_type='video', chunk_size=None, max_parallel=None, **options):
+    """
+    Upload a large file to Cloudinary in chunks, several at a time
+
+    All chunks but the last are sent concurrently; the last one is sent once the
+    others have arrived, because Cloudinary assembles the file when it receives
+    the final byte range. Each chunk is retried on its own, so a failure only
+    costs that chunk instead of the whole file. How many chunks are in flight is
+    tuned by the shared upload limiter unless max_parallel fixes it.
+
+    Chunk failures count against a breaker private to this upload; the shared
+    'cloudinary-upload' breaker sees the whole upload as a single call, so a
+    burst of chunk retries on a congested link neither aborts the other chunks
+    nor blocks every other upload in the process.
+
+    Args:
+        file_path (str): Local file to upload
+        resource_type (str): 'video', 'image' or 'raw'
+        chunk_size (int): Bytes per chunk (minimum 5 MB)
+        max_parallel (int): Upper bound on chunks in flight (optional)
+        **options: Extra upload parameters (public_id, folder, eager, ...)
+
+    Returns:
+        dict: Upload result, as returned by Cloudinary's upload API
+    """
+    chunk_size = max(MIN_CHUNK_SIZE, chunk_size or DEFAULT_CHUNK_SIZE)
+    limiter = get_upload_limiter()
+    max_parallel = max_parallel or limiter.max_level
+    total_size = os.path.getsize(file_path)
+    name = os.path.basename(file_path)
+
+    shared_breaker = default_policy.breaker('cloudinary-upload')
+    if not shared_breaker.allow():
+        raise CircuitOpenError("Circuit open for cloudinary-upload, skipping call")
+    # Two rounds of failed chunks in a row mean the link is down, not congested
+    chunk_breaker = CircuitBreaker(failure_threshold=2 * max_parallel, reset_timeout=default_policy.reset_timeout)
+
+    url, params = signed_upload(resource_type, **options)
+    upload_id = uuid.uuid4().hex
+
+    ranges = [(start, min(start + chunk_size, total_size)) for start in range(0, total_size, chunk_size)]
+    progress = {'sent': 0}
+    progress_lock = threading.Lock()
+    started = time.time()
+
+    def send_chunk(start, end):
+        # Each chunk is streamed from its byte range of the file instead of being read into memory
+        with limiter.transfer(end - start), \
+                MultipartFileStream(params, 'file', file_path, name, start, end - start) as body:
+            headers = {
+                'Content-Type': body.content_type,
+                'X-Unique-Upload-Id': upload_id,
+                'Content-Range': f"bytes {start}-{end - 1}/{total_size}",
+            }
+            response = session.post(url, data=body, headers=headers, timeout=300)
+            return raise_for_cloudinary_error(response)
+
+    def upload_chunk(chunk_range):
+        start, end = chunk_range
+        result = retry_call(send_chunk, start, end, endpoint='cloudinary-upload', breaker=chunk_breaker)
+        with progress_lock:
+            progress['sent'] += end - start
+            percent = progress['sent'] * 100 // total_size
+            rate = progress['sent'] / max(time.time() - started, 0.001) / 1024 / 1024
+        print(f"  📦 {name}: {percent}% ({progress['sent'] // (1024 * 1024)}/{total_size // (1024 * 1024)} MB, {rate:.1f} MB/s)")
+        return result
+
+    print(f"  ☁️ Chunked upload: {name} ({len(ranges)} chunks of {chunk_size // (1024 * 1024)} MB, "
+          f"{limiter.level} in parallel, adjusted to throughput)")
+
+    try:
+        if len(ranges) > 1:
+            with ContextExecutor(max_workers=max_parallel) as executor:
+                # Consuming the results re-raises the first chunk that failed after its retries
+                list(executor.map(upload_chunk, ranges[:-1]))
+        result = upload_chunk(ranges[-1])
+    except Exception as e:
+        if isinstance(e, CircuitOpenError) or classify_exception(e) != FATAL:
+            shared_breaker.record_failure()
+        raise
+    shared_breaker.record_success()
+    return result
+
+def upload_file(file_path, file_size, resource_type='image', **options):
+    """Single-request upload, streamed from disk, holding a slot of the shared upload limiter"""
+    url, params = signed_upload(resource_type, **options)
+    with get_upload_limiter().transfer(file_size), MultipartFileStream(params, 'file', file_path) as body:
+        response = session.post(url, data=body, headers={'Content-Type': body.content_type}, timeout=300)
+        return raise_for_cloudinary_error(response)
+
+def delivery_transformation(resource_type, surface):
+    """Delivery transformation for a resource type and target surface ('feed', 'stories' or 'reels')"""
+    if resource_type == 'video':
+        return dict(VIDEO_DELIVERY)
+    return dict(IMAGE_DELIVERY['stories' if surface == 'stories' else 'feed'])
+
+def upload_media(file_path, resource_type='image', surface=None, **options):
+    """
+    Upload a local file to Cloudinary, choosing chunked upload for large files
+
+    With a target surface, the delivery variant Instagram should fetch is derived
+    eagerly during the upload, so it already exists when Instagram requests it,
+    and its URL is returned as 'delivery_url'.
+
+    Args:
+        file_path (str): Local file to upload
+        resource_type (str): 'image' or 'video'
+        surface (str): 'feed', 'stories' or 'reels' to derive a delivery variant (optional)
+        **options: Extra upload parameters
+
+    Returns:
+        dict: Upload result with 'secure_url', 'public_id' and 'delivery_url'
+    """
+    file_size = os.path.getsize(file_path)
+    eager_ready = False
+
+    if surface:
+        options['eager'] = [delivery_transformation(resource_type, surface)]
+        eager_ready = resource_type != 'video' or file_size <= SYNC_EAGER_VIDEO_LIMIT
+        if not eager_ready:
+            options['eager_async'] = True
+
+    if file_size >= LARGE_FILE_THRESHOLD:
+        result = upload_large_parallel(file_path, resource_type=resource_type, **options)
+    else:
+        result = retry_call(upload_file, file_path, file_size, resource_type=resource_type,
+                            endpoint='cloudinary-upload', **options)
+
+    eager = result.get('eager') or []
+    if eager_ready and eager and eager[0].get('secure_url'):
+        result['delivery_url'] = eager[0]['secure_url']
+    else:
+        # Large videos are derived in the background; Instagram gets the original
+        # rather than a variant that may still be processing
+        result['delivery_url'] = result['secure_url']
+    return result
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+from utils.retry_policy import graph_request, GRAPH_NOT_FOUND_CODES
+
+# Graph API limit on IDs per multi-ID request
+MAX_IDS_PER_REQUEST = 50
+TERMINAL_STATUSES = {'FINISHED', 'ERROR', 'EXPIRED', 'PUBLISHED'}
+
+class ContainerStatusService:
+    """Poll the status of every pending media container with one request per interval.
+
+    Jobs register their creation IDs and wait; a single background thread asks
+    for all of them at once (?ids=a,b,c&fields=status_code) and wakes each
+    waiter when its container reaches a terminal status.
+    """
+
+    def __init__(self, interval=5):
+        self.interval = interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        # Set when a container is registered, so a sleeping loop picks up its first check on time
+        self.wakeup = threading.Event()
+
+    def register(self, creation_id, first_check_after=None, fast_interval=None, fast_until=None):
+        """
+        Start tracking a container (no-op if it is already tracked)
+
+        With `first_check_after` (seconds), the container is not polled before
+        then, e.g. when its processing time is known to be longer. With
+        `fast_interval`, it is checked that often (instead of every interval)
+        until `fast_until` seconds from now, e.g. around its predicted ready time.
+        """
+        now = time.time()
+        not_before = now + first_check_after if first_check_after else 0
+        with self.lock:
+            if creation_id not in self.pending:
+                self.pending[creation_id] = {'event': threading.Event(), 'status': None, 'waiters': 0,
+                                             'checks': 0, 'not_before': not_before,
+                                             'fast_interval': None, 'fast_until': 0}
+            else:
+                # Another waiter wants it sooner
+                entry = self.pending[creation_id]
+                entry['not_before'] = min(entry['not_before'], not_before)
+            if fast_interval and fast_until:
+                entry = self.pending[creation_id]
+                entry['fast_interval'] = min(entry['fast_interval'] or fast_interval, fast_interval)
+                entry['fast_until'] = max(entry['fast_until'], now + fast_until)
+            self.pending[creation_id]['waiters'] += 1
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.wakeup.set()
+            return self.pending[creation_id]
+
+    def release(self, creation_id):
+        """Stop tracking a container once nobody waits for it"""
+        with self.lock:
+            entry = self.pending.get(creation_id)
+            if entry:
+                entry['waiters'] -= 1
+                if entry['waiters'] <= 0:
+                    del self.pending[creation_id]
+
+    def wait(self, creation_id, timeout=300, first_check_after=None, fast_interval=None, fast_until=None):
+        """
+        Block until a container reaches a terminal status
+
+        Args:
+            creation_id (str): Container ID returned by the /media endpoint
+            timeout (float): Maximum seconds to wait
+            first_check_after (float): Seconds before the first status check (optional)
+            fast_interval (float): Seconds between checks until fast_until (optional)
+            fast_until (float): Seconds from now during which fast_interval applies (optional)
+
+        Returns:
+            dict: Last status response ({'status_code': ..., 'status': ...}) with
+                  'checks', the number of status checks that reached the container,
+                  or {'status_code': None} on timeout
+        """
+        entry = self.register(creation_id, first_check_after, fast_interval, fast_until)
+        try:
+            entry['event'].wait(timeout)
+            return entry['status'] or {'status_code': None}
+        finally:
+            self.release(creation_id)
+
+    def fetch(self, creation_ids):
+        """
+        Fetch the status of several containers in one request
+
+        Returns:
+            dict: creation_id -> status response. Containers whose status could not
+                  be fetched (network errors, throttling, open circuit, expired
+                  token) are left out and checked again on the next poll.
+        """
+        params = {
+            'ids': ','.join(creation_ids),
+            'fields': 'status_code,status',
+            'access_token': os.getenv('ACCESS_TOKEN')
+        }
+        result = graph_request('GET', "https://graph.facebook.com/v18.0/", params=params, hedge_after=5)
+
+        if 'error' in result and result['error'].get('code') not in GRAPH_NOT_FOUND_CODES:
+            # The request failed, not the containers; only the API can say a container failed
+            print(f"⚠️ Container status check failed, retrying on the next poll: {result['error'].get('message')}")
+            return {}
+        if 'error' in result and len(creation_ids) > 1:
+            # One bad ID fails the whole request; fall back to checking each individually
+            statuses = {}
+            for creation_id in creation_ids:
+                statuses.update(self.fetch([creation_id]))
+            return statuses
+        if 'error' in result:
+            return {creation_ids[0]: {'status_code': 'ERROR', 'status': result['error']}}
+        return result
+
+    def poll_once(self):
+        """Check every pending container that is due and wake the waiters of finished ones"""
+        now = time.time()
+        with self.lock:
+            creation_ids = [cid for cid, entry in self.pending.items()
+                            if not entry['event'].is_set() and entry['not_before'] <= now]
+
+        for start in range(0, len(creation_ids), MAX_IDS_PER_REQUEST):
+            chunk = creation_ids[start:start + MAX_IDS_PER_REQUEST]
+            statuses = self.fetch(chunk)
+
+            checked_at = time.time()
+            with self.lock:
+                for creation_id in chunk:
+                    entry = self.pending.get(creation_id)
+                    status = statuses.get(creation_id)
+                    if not entry or not status:
+                        continue
+                    entry['checks'] += 1
+                    entry['status'] = dict(status, checks=entry['checks'])
+                    if entry['fast_interval'] and checked_at < entry['fast_until']:
+                        entry['not_before'] = checked_at + entry['fast_interval']
+                    if status.get('status_code') in TERMINAL_STATUSES:
+                        entry['event'].set()
+
+        return len(creation_ids)
+
+    def run(self):
+        """Background loop, exits when nothing is pending"""
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+            checked = self.poll_once()
+            if checked:
+                print(f"📊 Checked {checked} pending container(s) in one request")
+            self.wakeup.wait(self.next_delay())
+            self.wakeup.clear()
+
+    def next_delay(self):
+        """Seconds until the next poll: the interval, or sooner if a deferred container comes due"""
+        now = time.time()
+        with self.lock:
+            deferred = [entry['not_before'] - now for entry in self.pending.values()
+                        if not entry['event'].is_set() and entry['not_before'] > now]
+        return max(0.1, min([self.interval] + deferred))
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_status_service():
+    """Shared status service for this process"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ContainerStatusService()
+        return _service
+
+def wait_for_container(creation_id, timeout=300, first_check_after=None, fast_interval=None, fast_until=None):
+    """Wait for one container through the shared status service"""
+    return get_status_service().wait(creation_id, timeout, first_check_after, fast_interval, fast_until)
+
+def wait_for_containers(creation_ids, timeout=300):
+    """
+    Wait for several containers at once
+
+    Returns:
+        dict: creation_id -> last status response
+    """
+    service = get_status_service()
+    entries = {creation_id: service.register(creation_id) for creation_id in creation_ids}
+    deadline = time.time() + timeout
+    try:
+        for entry in entries.values():
+            entry['event'].wait(max(0, deadline - time.time()))
+        return {creation_id: entry['status'] or {'status_code': None} for creation_id, entry in entries.items()}
+    finally:
+        for creation_id in creation_ids:
+            service.release(creation_id)
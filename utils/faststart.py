@@ -0,0 +1,61 @@
+import os
+import struct
+import subprocess
+import tempfile
+import time
+
+from utils.preflight import find_top_level_boxes
+
+MP4_EXTENSIONS = ('.mp4', '.mov', '.m4v')
+
+def needs_faststart(path):
+    """
+    Whether an MP4's moov box comes after its media data
+
+    Only the top-level box headers are read. With the moov box at the end, a
+    reader has to fetch the whole file before it can start processing it.
+    """
+    if not path.lower().endswith(MP4_EXTENSIONS):
+        return False
+    try:
+        boxes = find_top_level_boxes(path)
+    except (OSError, struct.error):
+        return False
+
+    moov = next((offset for box_type, offset, _ in boxes if box_type == b'moov'), None)
+    mdat = next((offset for box_type, offset, _ in boxes if box_type == b'mdat'), None)
+    return moov is not None and mdat is not None and moov > mdat
+
+def ensure_faststart(path):
+    """
+    Remux a video with a trailing moov box to faststart layout, without re-encoding
+
+    The original file is left untouched; the remuxed copy is written to a
+    temporary file that the caller removes once it has been uploaded.
+
+    Returns:
+        tuple: (path to upload, True if it is a temporary remuxed copy)
+    """
+    if not needs_faststart(path):
+        return path, False
+
+    fd, output_path = tempfile.mkstemp(prefix='faststart_', suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', path, '-map', '0', '-c', 'copy', '-movflags', '+faststart', output_path]
+
+    started = time.time()
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        print("⚠️ FFmpeg not found, uploading without faststart. Install with: brew install ffmpeg")
+        os.remove(output_path)
+        return path, False
+
+    if result.returncode != 0:
+        print(f"⚠️ Faststart remux failed for {os.path.basename(path)}, uploading the original: {result.stderr[-300:]}")
+        os.remove(output_path)
+        return path, False
+
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"⚡ Moved moov box to the front of {os.path.basename(path)} ({size_mb:.1f} MB, {time.time() - started:.1f}s, no re-encode)")
+    return output_path, True
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Local store of published media and incremental insights sync
+
+Every media ID the posting scripts publish is recorded in published_media.db.
+Run `python utils/insights.py` (e.g. from cron every hour) to fetch insights for
+the media that are due: recent posts are synced often, older ones rarely, and
+up to 50 media are fetched per Graph API call. Interrupted syncs resume where
+they stopped, since each batch is committed as soon as it is fetched.
+
+`--import` also pulls media published outside these scripts from the account's
+/media edge, page by page, remembering the paging cursor between runs.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import closing
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from dotenv import load_dotenv
+from utils.retry_policy import graph_request, classify_graph_error, RATE_LIMITED, GRAPH_NOT_FOUND_CODES
+from utils.priority import lane
+
+load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
+
+GRAPH_URL = "https://graph.facebook.com/v18.0"
+# Graph API limit on IDs per multi-ID request
+MAX_IDS_PER_REQUEST = 50
+
+HOUR = 3600
+DAY = 24 * HOUR
+# (maximum age, sync interval): metrics move fast in the first days and barely after a month
+SYNC_SCHEDULE = [
+    (2 * DAY, HOUR),
+    (7 * DAY, 6 * HOUR),
+    (30 * DAY, DAY),
+    (90 * DAY, 7 * DAY),
+]
+OLD_MEDIA_INTERVAL = 30 * DAY
+# Story insights are only available while the story is live
+STORY_LIFETIME = DAY
+# Media that keeps failing (deleted, insights unavailable) is dropped from the schedule
+MAX_FAILURES = 5
+
+METRICS = {
+    'FEED': ['impressions', 'reach', 'saved', 'total_interactions'],
+    'REELS': ['plays', 'reach', 'saved', 'shares', 'total_interactions', 'ig_reels_avg_watch_time'],
+    'STORY': ['impressions', 'reach', 'replies', 'exits', 'taps_forward', 'taps_back'],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    media_id TEXT PRIMARY KEY,
+    surface TEXT NOT NULL,
+    published_at REAL NOT NULL,
+    last_synced_at REAL,
+    next_sync_at REAL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    insights TEXT
+);
+CREATE INDEX IF NOT EXISTS media_next_sync ON media (next_sync_at);
+CREATE TABLE IF NOT EXISTS snapshots (
+    media_id TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    insights TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_media ON snapshots (media_id, fetched_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def sync_interval(surface, age):
+    """
+    Seconds until a media item should be synced again
+
+    Returns:
+        float: Interval, or None when the item no longer needs syncing
+    """
+    if surface == 'STORY':
+        return HOUR if age < STORY_LIFETIME else None
+    for max_age, interval in SYNC_SCHEDULE:
+        if age < max_age:
+            return interval
+    return OLD_MEDIA_INTERVAL
+
+def parse_insights(item):
+    """Flatten a media node with an insights edge into {metric: value}"""
+    values = {}
+    for field in ('like_count', 'comments_count'):
+        if field in item:
+            values[field] = item[field]
+    for metric in item.get('insights', {}).get('data', []):
+        if metric.get('values'):
+            values[metric['name']] = metric['values'][0].get('value')
+        elif 'total_value' in metric:
+            values[metric['name']] = metric['total_value'].get('value')
+    return values
+
+class InsightsStore:
+    """SQLite store of published media and their latest insights"""
+
+    def __init__(self, db_file=None):
+        self.db_file = db_file or os.path.join(PROJECT_ROOT, 'published_media.db')
+        self.lock = threading.Lock()
+        with closing(self.connect()) as db:
+            db.executescript(SCHEMA)
+
+    def connect(self):
+        # A connection per call keeps the store usable from the worker's threads
+        return sqlite3.connect(self.db_file, timeout=30)
+
+    def record(self, media_id, surface, published_at=None):
+        """
+        Add a published media item; it is synced for the first time an hour after publishing
+
+        Returns:
+            bool: True if the item was not known yet
+        """
+        published_at = published_at or time.time()
+        with self.lock, closing(self.connect()) as db, db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO media (media_id, surface, published_at, next_sync_at) VALUES (?, ?, ?, ?)",
+                (str(media_id), surface, published_at, published_at + HOUR)
+            )
+            return cursor.rowcount > 0
+
+    def get_state(self, key):
+        with closing(self.connect()) as db:
+            row = db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        with self.lock, closing(self.connect()) as db, db:
+            if value is None:
+                db.execute("DELETE FROM sync_state WHERE key = ?", (key,))
+            else:
+                db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def due_media(self, surface, limit, now=None):
+        """Media of one surface whose next sync time has passed, most overdue first"""
+        now = now or time.time()
+        with closing(self.connect()) as db:
+            return db.execute(
+                "SELECT media_id, published_at FROM media "
+                "WHERE surface = ? AND next_sync_at IS NOT NULL AND next_sync_at <= ? "
+                "ORDER BY next_sync_at LIMIT ?",
+                (surface, now, limit)
+            ).fetchall()
+
+    def save_results(self, surface, published, results, failed):
+        """
+        Store one fetched batch and schedule each item's next sync
+
+        Args:
+            surface (str): Surface of the batch
+            published (dict): media_id -> published_at
+            results (dict): media_id -> {metric: value}
+            failed (list): media IDs whose insights could not be fetched
+        """
+        now = time.time()
+        with self.lock, closing(self.connect()) as db, db:
+            for media_id, values in results.items():
+                interval = sync_interval(surface, now - published[media_id])
+                encoded = json.dumps(values)
+                db.execute(
+                    "UPDATE media SET insights = ?, last_synced_at = ?, next_sync_at = ?, failures = 0 WHERE media_id = ?",
+                    (encoded, now, now + interval if interval else None, media_id)
+                )
+                db.execute("INSERT INTO snapshots (media_id, fetched_at, insights) VALUES (?, ?, ?)",
+                           (media_id, now, encoded))
+            for media_id in failed:
+                db.execute(
+                    "UPDATE media SET failures = failures + 1, "
+                    "next_sync_at = CASE WHEN failures + 1 >= ? THEN NULL ELSE ? END WHERE media_id = ?",
+                    (MAX_FAILURES, now + HOUR, media_id)
+                )
+
+    def counts(self):
+        """Number of media per surface, and how many are currently due"""
+        with closing(self.connect()) as db:
+            rows = db.execute(
+                "SELECT surface, COUNT(*), SUM(next_sync_at IS NOT NULL AND next_sync_at <= ?) FROM media GROUP BY surface",
+                (time.time(),)
+            ).fetchall()
+        return {surface: {'total': total, 'due': due or 0} for surface, total, due in rows}
+
+def is_media_error(result):
+    """Whether a Graph API error is about the requested media (deleted, unknown, unsupported)"""
+    error = result.get('error')
+    return isinstance(error, dict) and error.get('code') in GRAPH_NOT_FOUND_CODES
+
+class InsightsSync:
+    """Fetch insights for due media in batched multi-ID Graph API calls"""
+
+    def __init__(self, store=None, max_requests=150):
+        self.store = store or get_insights_store()
+        self.access_token = os.getenv('ACCESS_TOKEN')
+        self.account_id = os.getenv('ACCOUNT_ID')
+        # Request budget per run, so a big backlog is spread over several runs within rate limits
+        self.max_requests = max_requests
+        self.requests_made = 0
+        # Set when an error is about the run (throttling, token, outage), not a media item
+        self.stopped = False
+
+    def request(self, url, params):
+        """
+        Graph API GET that counts against the budget
+
+        The run stops on any error other than one about the requested media
+        (unknown or unsupported ID): rate limits, an expired token, server
+        errors left after retries or an open circuit say nothing about the
+        media, so they must not count as its failures.
+        """
+        self.requests_made += 1
+        params['access_token'] = self.access_token
+        result = graph_request('GET', url, params=params)
+        if 'error' in result and not is_media_error(result):
+            if classify_graph_error(result) == RATE_LIMITED:
+                print("⏸️ Rate limited, stopping; the next run continues from here")
+            else:
+                error = result['error']
+                print(f"⏸️ Graph API error, stopping; the next run continues from here: "
+                      f"{error.get('message', error) if isinstance(error, dict) else error}")
+            self.stopped = True
+        return result
+
+    def budget_left(self):
+        return not self.stopped and self.requests_made < self.max_requests
+
+    def fetch_batch(self, surface, media_ids):
+        """
+        Fetch insights for up to 50 media of one surface in one request
+
+        Returns:
+            tuple: (results dict media_id -> metrics, list of failed media IDs)
+        """
+        fields = f"like_count,comments_count,insights.metric({','.join(METRICS[surface])})"
+        result = self.request(f"{GRAPH_URL}/", {'ids': ','.join(media_ids), 'fields': fields})
+        if self.stopped:
+            return {}, []
+
+        if 'error' in result and len(media_ids) > 1:
+            # One deleted or unsupported media fails the whole request; retry each on its own
+            results, failed = {}, []
+            for media_id in media_ids:
+                if not self.budget_left():
+                    break
+                one_result, one_failed = self.fetch_batch(surface, [media_id])
+                results.update(one_result)
+                failed += one_failed
+            return results, failed
+        if 'error' in result:
+            return {}, list(media_ids)
+
+        return {media_id: parse_insights(item) for media_id, item in result.items()}, \
+            [media_id for media_id in media_ids if media_id not in result]
+
+    def sync(self):
+        """
+        Sync every due media item the request budget allows
+
+        Returns:
+            dict: 'synced', 'failed' and 'requests' counts
+        """
+        synced = failed = 0
+        for surface in METRICS:
+            while self.budget_left():
+                due = self.store.due_media(surface, MAX_IDS_PER_REQUEST)
+                if not due:
+                    break
+                published = dict(due)
+                results, failures = self.fetch_batch(surface, list(published))
+                if not results and not failures:
+                    break
+                self.store.save_results(surface, published, results, failures)
+                synced += len(results)
+                failed += len(failures)
+                print(f"📈 {surface}: synced {len(results)} media" + (f", {len(failures)} failed" if failures else ""))
+
+        return {'synced': synced, 'failed': failed, 'requests': self.requests_made}
+
+    def import_media(self, page_size=100):
+        """
+        Record media published outside these scripts from the account's /media edge
+
+        The first import pages through the whole account, saving the paging
+        cursor after every page so it can be resumed. Later imports only read
+        from the newest media until they reach a page with nothing new.
+
+        Returns:
+            int: Number of media added
+        """
+        complete = self.store.get_state('import_complete')
+        after = self.store.get_state('import_after')
+        added = 0
+
+        while self.budget_left():
+            params = {'fields': 'id,media_product_type,timestamp', 'limit': page_size}
+            if after:
+                params['after'] = after
+            result = self.request(f"{GRAPH_URL}/{self.account_id}/media", params)
+            if 'error' in result:
+                if not self.stopped:
+                    print(f"❌ Media import failed: {result['error']}")
+                break
+
+            new_on_page = 0
+            for item in result.get('data', []):
+                surface = item.get('media_product_type', 'FEED')
+                if surface not in METRICS:
+                    continue
+                published_at = datetime.strptime(item['timestamp'], '%Y-%m-%dT%H:%M:%S%z').timestamp()
+                if self.store.record(item['id'], surface, published_at):
+                    new_on_page += 1
+            added += new_on_page
+
+            paging = result.get('paging', {})
+            after = paging.get('cursors', {}).get('after') if paging.get('next') else None
+            if complete and new_on_page == 0:
+                break
+            if not complete:
+                self.store.set_state('import_after', after)
+            if not after:
+                self.store.set_state('import_complete', 1)
+                break
+
+        print(f"📥 Imported {added} media from the account")
+        return added
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_insights_store():
+    """Shared store, opened once per process"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = InsightsStore()
+        return _store
+
+def record_media(media_id, surface):
+    """Remember a published media ID ('FEED', 'REELS' or 'STORY') for insights syncing"""
+    try:
+        get_insights_store().record(media_id, surface)
+    except sqlite3.Error as e:
+        # Never fail a post that is already live because of the local store
+        print(f"⚠️ Could not record media {media_id} for insights: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Instagram insights for published media")
+    parser.add_argument('--import', dest='import_media', action='store_true',
+                        help="Also record media published outside these scripts")
+    parser.add_argument('--max-requests', type=int, default=150, help="Graph API requests per run")
+    args = parser.parse_args()
+
+    sync = InsightsSync(max_requests=args.max_requests)
+    # Insights never compete with posting for API calls
+    with lane('backfill'):
+        if args.import_media:
+            sync.import_media()
+        summary = sync.sync()
+
+    print(f"\n✅ Synced {summary['synced']} media ({summary['failed']} failed) in {summary['requests']} requests")
+    for surface, count in sorted(sync.store.counts().items()):
+        print(f"  {surface}: {count['total']} media, {count['due']} still due")
+
+if __name__ == "__main__":
+    main()
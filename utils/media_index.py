@@ -0,0 +1,351 @@
+import os
+import struct
+import subprocess
+import threading
+from array import array
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov')
+
+# Multi-index hashing: 64-bit hashes are split into 4 substrings of 16 bits.
+# Two hashes within Hamming distance 7 differ in at most one bit on at least one
+# substring (pigeonhole: 4 x 2 bits = 8), so a lookup probes every substring's
+# value and its 16 one-bit neighbours, and only compares against the entries
+# found there. 16-bit keys keep each bucket at about N/65536 entries.
+SUBSTRINGS = 4
+SUBSTRING_BITS = 16
+SUBSTRING_MASK = (1 << SUBSTRING_BITS) - 1
+MAX_RADIUS = 1
+MAX_DISTANCE = SUBSTRINGS * (MAX_RADIUS + 1) - 1
+
+# The substring tables are saved next to the index file so a run does not
+# rebuild them; they are rebuilt once this many entries were added since
+REBUILD_AFTER = 10000
+CACHE_MAGIC = b'MIDX0001'
+CACHE_HEADER = struct.Struct('<8sQQQ')
+
+def popcount(value):
+    """Number of set bits"""
+    return bin(value).count('1')
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+
+def substrings(value):
+    """The 16-bit substrings of a 64-bit hash"""
+    return [(value >> (i * SUBSTRING_BITS)) & SUBSTRING_MASK for i in range(SUBSTRINGS)]
+
+def read_array(data, pos, typecode, count):
+    """Read `count` items of an array from a bytes buffer; returns (array, next position)"""
+    values = array(typecode)
+    end = pos + values.itemsize * count
+    if end > len(data):
+        raise ValueError("truncated media index cache")
+    values.frombytes(data[pos:end])
+    return values, end
+
+def probe_keys(key, radius):
+    """A substring value and, with radius 1, every value one bit away"""
+    if radius == 0:
+        return [key]
+    return [key] + [key ^ (1 << bit) for bit in range(SUBSTRING_BITS)]
+
+def dhash_frames(path, is_video=False, interval=2, max_frames=10):
+    """
+    Compute 64-bit difference hashes for an image or sampled video frames
+
+    Frames are scaled to 9x8 grayscale by ffmpeg, so nothing is decoded at full
+    size in Python and re-encoded copies of the same media hash alike.
+
+    Args:
+        path (str): Local path of the media file
+        is_video (bool): Sample one frame every `interval` seconds instead of a single image
+        interval (int): Seconds between sampled video frames
+        max_frames (int): Maximum number of video frames to sample
+
+    Returns:
+        list: Hashes as ints, empty if the file could not be decoded
+    """
+    if is_video:
+        vf = f"fps=1/{interval},scale=9:8:flags=area,format=gray"
+        frame_args = ['-frames:v', str(max_frames)]
+    else:
+        vf = "scale=9:8:flags=area,format=gray"
+        frame_args = ['-frames:v', '1']
+
+    cmd = ['ffmpeg', '-v', 'error', '-i', path, '-vf', vf] + frame_args + ['-f', 'rawvideo', '-']
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+    except FileNotFoundError:
+        print("⚠️ FFmpeg not found, duplicate check skipped. Install with: brew install ffmpeg")
+        return []
+
+    if result.returncode != 0:
+        return []
+
+    hashes = []
+    pixels = result.stdout
+    for offset in range(0, len(pixels) - 71, 72):
+        frame = pixels[offset:offset + 72]
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                left = frame[row * 9 + col]
+                right = frame[row * 9 + col + 1]
+                value = (value << 1) | (1 if left > right else 0)
+        hashes.append(value)
+    return hashes
+
+class MediaIndex:
+    """Perceptual-hash index of everything that has been published.
+
+    Entries live in an append-only media_index.tsv. For each 16-bit substring,
+    positions are kept sorted by substring value with an offset table, so a
+    probe is two array reads; entries added since the tables were built sit in
+    small dict buckets. The tables are cached in media_index.idx together with
+    how much of the TSV they cover, and a run only parses the lines after that.
+    """
+
+    def __init__(self, index_file=None):
+        self.index_file = index_file or os.path.join(PROJECT_ROOT, 'media_index.tsv')
+        self.cache_file = os.path.splitext(self.index_file)[0] + '.idx'
+        self.hashes = array('Q')
+        # Media ID of every entry, as a number into media_names
+        self.media_refs = array('I')
+        self.media_names = []
+        self.media_numbers = {}
+        # Entries [0, indexed) are in the sorted tables, later ones in `recent`
+        self.indexed = 0
+        self.offsets = []
+        self.positions = []
+        self.recent = [dict() for _ in range(SUBSTRINGS)]
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load the cached tables and the index file lines added after them"""
+        if not os.path.exists(self.index_file):
+            return
+        covered = self.load_cache()
+        with open(self.index_file, 'rb') as f:
+            f.seek(covered)
+            tail = f.read()
+        # A line still being written by another process is left for the next load
+        end = tail.rfind(b'\n') + 1
+        for line in tail[:end].decode('utf-8', errors='replace').splitlines():
+            parts = line.split('\t', 2)
+            if len(parts) < 2:
+                continue
+            try:
+                value = int(parts[0], 16)
+            except ValueError:
+                continue
+            self.append(value, parts[1])
+
+        if len(self.hashes) - self.indexed > REBUILD_AFTER:
+            self.rebuild()
+            self.save_cache(covered + end)
+        else:
+            for position in range(self.indexed, len(self.hashes)):
+                self.index_recent(position)
+
+    def load_cache(self):
+        """
+        Read the cached tables
+
+        Returns:
+            int: Bytes of the index file they cover, 0 without a usable cache
+        """
+        try:
+            with open(self.cache_file, 'rb') as f:
+                data = f.read()
+            magic, covered, count, names_size = CACHE_HEADER.unpack_from(data)
+            if magic != CACHE_MAGIC or covered > os.path.getsize(self.index_file):
+                return 0
+
+            pos = CACHE_HEADER.size
+            hashes, pos = read_array(data, pos, 'Q', count)
+            media_refs, pos = read_array(data, pos, 'I', count)
+            media_names = data[pos:pos + names_size].decode('utf-8').split('\n') if names_size else []
+            pos += names_size
+            offsets, positions = [], []
+            for _ in range(SUBSTRINGS):
+                table, pos = read_array(data, pos, 'I', SUBSTRING_MASK + 2)
+                offsets.append(table)
+                table, pos = read_array(data, pos, 'I', count)
+                positions.append(table)
+        except (OSError, struct.error, ValueError, UnicodeDecodeError):
+            return 0
+
+        self.hashes, self.media_refs, self.media_names = hashes, media_refs, media_names
+        self.media_numbers = {name: number for number, name in enumerate(media_names)}
+        self.offsets, self.positions, self.indexed = offsets, positions, count
+        return covered
+
+    def save_cache(self, covered):
+        """Write the tables and how much of the index file they cover, atomically"""
+        names = '\n'.join(self.media_names).encode('utf-8')
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(CACHE_HEADER.pack(CACHE_MAGIC, covered, self.indexed, len(names)))
+                f.write(self.hashes[:self.indexed].tobytes())
+                f.write(self.media_refs[:self.indexed].tobytes())
+                f.write(names)
+                for offsets, positions in zip(self.offsets, self.positions):
+                    f.write(offsets.tobytes())
+                    f.write(positions.tobytes())
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"⚠️ Could not write media index cache: {e}")
+
+    def rebuild(self):
+        """Sort every entry into the substring tables"""
+        count = len(self.hashes)
+        self.offsets, self.positions = [], []
+        for i in range(SUBSTRINGS):
+            shift = i * SUBSTRING_BITS
+            keys = [(value >> shift) & SUBSTRING_MASK for value in self.hashes]
+            counts = [0] * (SUBSTRING_MASK + 2)
+            for key in keys:
+                counts[key + 1] += 1
+            for key in range(SUBSTRING_MASK + 1):
+                counts[key + 1] += counts[key]
+            self.offsets.append(array('I', counts))
+            self.positions.append(array('I', sorted(range(count), key=keys.__getitem__)))
+        self.indexed = count
+        self.recent = [dict() for _ in range(SUBSTRINGS)]
+
+    def append(self, value, media_id):
+        """Add an entry without indexing it; returns its position"""
+        number = self.media_numbers.get(media_id)
+        if number is None:
+            number = self.media_numbers[media_id] = len(self.media_names)
+            self.media_names.append(media_id)
+        self.hashes.append(value)
+        self.media_refs.append(number)
+        return len(self.hashes) - 1
+
+    def index_recent(self, position):
+        for buckets, key in zip(self.recent, substrings(self.hashes[position])):
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [position]
+            else:
+                bucket.append(position)
+
+    def insert(self, value, media_id):
+        """Add a hash to the in-memory index"""
+        self.index_recent(self.append(value, media_id))
+
+    def lookup(self, value, max_distance=6):
+        """
+        Find indexed hashes close to `value`
+
+        Returns:
+            dict: media_id -> smallest Hamming distance found
+        """
+        max_distance = min(max_distance, MAX_DISTANCE)
+        # Up to distance 3 an exact match on one substring is guaranteed
+        radius = max_distance // SUBSTRINGS
+        hashes = self.hashes
+        candidates = set()
+
+        for i, key in enumerate(substrings(value)):
+            offsets = self.offsets[i] if self.indexed else None
+            buckets = self.recent[i]
+            for probe in probe_keys(key, radius):
+                if offsets:
+                    candidates.update(self.positions[i][offsets[probe]:offsets[probe + 1]])
+                bucket = buckets.get(probe)
+                if bucket:
+                    candidates.update(bucket)
+
+        matches = {}
+        for position in candidates:
+            distance = popcount(hashes[position] ^ value)
+            if distance <= max_distance:
+                media_id = self.media_names[self.media_refs[position]]
+                if distance < matches.get(media_id, max_distance + 1):
+                    matches[media_id] = distance
+        return matches
+
+    def find_duplicate(self, path, max_distance=6):
+        """
+        Check whether a file looks like media that was already published
+
+        Images match on their single hash. Videos match when at least half of
+        their sampled frames are close to frames of the same published item.
+
+        Returns:
+            dict: {'media_id', 'distance'} of the best match, or None
+        """
+        is_video = path.lower().endswith(VIDEO_EXTENSIONS)
+        hashes = dhash_frames(path, is_video)
+        if not hashes:
+            return None
+
+        frame_hits = {}
+        best_distance = {}
+        with self.lock:
+            for value in hashes:
+                for media_id, distance in self.lookup(value, max_distance).items():
+                    frame_hits[media_id] = frame_hits.get(media_id, 0) + 1
+                    best_distance[media_id] = min(distance, best_distance.get(media_id, distance))
+
+        needed = max(1, (len(hashes) + 1) // 2)
+        candidates = [media_id for media_id, hits in frame_hits.items() if hits >= needed]
+        if not candidates:
+            return None
+
+        media_id = min(candidates, key=lambda m: best_distance[m])
+        return {'media_id': media_id, 'distance': best_distance[media_id]}
+
+    def add(self, path, media_id):
+        """Hash a published file and append it to the index"""
+        is_video = path.lower().endswith(VIDEO_EXTENSIONS)
+        hashes = dhash_frames(path, is_video)
+        if not hashes:
+            return 0
+
+        posted_at = datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            with open(self.index_file, 'a') as f:
+                for value in hashes:
+                    f.write(f"{value:016x}\t{media_id}\t{os.path.basename(path)}\t{posted_at}\n")
+                    self.insert(value, media_id)
+        return len(hashes)
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_media_index():
+    """Shared index, loaded once per process"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MediaIndex()
+        return _index
+
+def find_duplicates(paths, max_distance=6):
+    """
+    Check several files against the index
+
+    Returns:
+        dict: path -> match dict, only for files that look already published
+    """
+    index = get_media_index()
+    duplicates = {}
+    for path in paths:
+        match = index.find_duplicate(path, max_distance)
+        if match:
+            duplicates[path] = match
+    return duplicates
+
+def record_published(paths, media_id):
+    """Add the files of a published post to the index"""
+    index = get_media_index()
+    for path in paths:
+        index.add(path, media_id)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Resident posting worker - keeps imports, connections and the token warm across jobs
+
+Jobs are JSON files dropped into the spool's incoming/ directory:
+    {"type": "post", "folder": "/path/to/media", "yaml_file": "/path/to/post.yaml"}
+    {"type": "reel", "video": "/path/to/video.mp4", "caption": "...", "cover_timestamp": 2.5,
+     "transcode": true}
+    {"type": "story", "media": ["/path/a.jpg", "/path/b.mp4"]}   (or "media": "/path/to/folder")
+
+An optional "priority" ("live", "scheduled" or "backfill") picks the job's lane;
+stories default to live, everything else to scheduled. Live jobs are claimed
+first and may use a reserved slot when every regular slot is busy, and their
+uploads and API calls go ahead of lower lanes (see utils/priority.py).
+
+Posts with a scheduled_publish_time never hold a slot while they wait: the job
+is parked in deferred/ until it can be staged (23h before the target), staged,
+and parked again until a minute before the target, when it is checked and
+published. A job with a "not_before" time is parked the same way on submit.
+
+Run with: python utils/posting_worker.py --spool spool --workers 4
+Each job moves through incoming/ -> processing/ -> done/ or failed/, and its
+status (with timestamps and result) is kept in status/<job_id>.json.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+for subdir in ('posts', 'reels', 'stories'):
+    sys.path.append(os.path.join(PROJECT_ROOT, 'instagram', subdir))
+
+from dotenv import load_dotenv
+from utils.priority import lane, lane_rank, LIVE, SCHEDULED
+from utils.profiling import enable_from_argv
+from utils.scheduler import parse_scheduled_time, staging_time, sleep_until, check_container, FINAL_CHECK_LEAD
+
+# Extra job slots only live jobs may use, so a story never waits for a bulk job to finish
+LIVE_RESERVED_SLOTS = 1
+DEFAULT_LANES = {'story': 'live'}
+
+ENV_FILE = os.path.join(PROJECT_ROOT, '.env')
+SPOOL_DIRS = ('incoming', 'processing', 'deferred', 'done', 'failed', 'status')
+
+def submit_job(job, spool_dir):
+    """
+    Queue a job for the worker
+
+    Args:
+        job (dict): Job description with a 'type' key
+        spool_dir (str): Spool directory watched by the worker
+
+    Returns:
+        str: Job ID
+    """
+    for name in SPOOL_DIRS:
+        os.makedirs(os.path.join(spool_dir, name), exist_ok=True)
+
+    job = dict(job)
+    job.setdefault('id', f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}")
+    job.setdefault('priority', job_lane(job))
+    rank = lane_rank(job['priority'])
+
+    # Write then rename so the worker never sees a partial file. The lane prefix
+    # makes a plain sort of incoming/ list the most urgent jobs first.
+    name = f"p{rank}-{job['id']}.json"
+    directory = 'incoming'
+    if job.get('not_before') and datetime.fromisoformat(job['not_before']) > datetime.now():
+        name, directory = deferred_name(job), 'deferred'
+    tmp_path = os.path.join(spool_dir, directory, f".{job['id']}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, os.path.join(spool_dir, directory, name))
+    return job['id']
+
+def deferred_name(job):
+    """File name of a parked job; the due time prefix makes a plain sort of deferred/ list the next due first"""
+    due = int(datetime.fromisoformat(job['not_before']).timestamp())
+    return f"{due:010d}-p{lane_rank(job_lane(job))}-{job['id']}.json"
+
+def job_lane(job):
+    """Priority lane of a job: its 'priority' key, or the default for its type"""
+    return job.get('priority') or DEFAULT_LANES.get(job.get('type'), 'scheduled')
+
+def spool_rank(name):
+    """Lane rank from a spool file name (files dropped in by hand count as scheduled)"""
+    if len(name) > 3 and name[0] == 'p' and name[1].isdigit() and name[2] == '-':
+        return int(name[1])
+    return SCHEDULED
+
+class PostingWorker:
+    """Long-running worker that runs posting jobs from a spool directory"""
+
+    def __init__(self, spool_dir, max_workers=4, poll_interval=1.0):
+        self.spool_dir = spool_dir
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.env_mtime = None
+        self.env_lock = threading.Lock()
+        self.stopping = False
+
+        for name in SPOOL_DIRS:
+            os.makedirs(os.path.join(spool_dir, name), exist_ok=True)
+
+        self.refresh_env()
+
+        # Import once: these configure Cloudinary and load their dependencies a single time
+        import instagram_post
+        import instagram_reels
+        import instagram_stories
+        self.instagram_post = instagram_post
+        self.instagram_reels = instagram_reels
+        self.instagram_stories = instagram_stories
+
+        self.handlers = {
+            'post': self.run_post,
+            'reel': self.run_reel,
+            'story': self.run_story,
+            'publish': self.run_publish,
+        }
+
+    def refresh_env(self):
+        """Reload .env when it changes (e.g. after auto_refresh_token.py rotated the token)"""
+        with self.env_lock:
+            try:
+                mtime = os.path.getmtime(ENV_FILE)
+            except OSError:
+                return
+            if mtime != self.env_mtime:
+                load_dotenv(dotenv_path=ENV_FILE, override=True)
+                if self.env_mtime is not None:
+                    print("🔑 Reloaded .env")
+                self.env_mtime = mtime
+
+    def write_status(self, job_id, status, **details):
+        """Record the current status of a job"""
+        info = {'id': job_id, 'status': status, 'updated_at': datetime.now().isoformat(timespec='seconds')}
+        info.update(details)
+        status_path = os.path.join(self.spool_dir, 'status', f"{job_id}.json")
+        tmp_path = f"{status_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(info, f, indent=2, default=str)
+        os.replace(tmp_path, status_path)
+
+    def defer(self, job, not_before, **changes):
+        """Result that parks the job (with `changes` applied) until `not_before`"""
+        return {'success': True, 'deferred': dict(job, not_before=not_before.isoformat(timespec='seconds'), **changes)}
+
+    def run_post(self, job):
+        post = self.instagram_post
+        config = job.get('config')
+        if config is None:
+            config = post.parse_post_config(job.get('yaml_file') or os.path.join(job['folder'], 'post.yaml'))
+        scheduled_time = parse_scheduled_time(config.get('scheduled_publish_time'))
+
+        if not scheduled_time or scheduled_time <= datetime.now():
+            media_id = post.post_folder(job['folder'], config=config)
+            return {'success': media_id is not None, 'media_id': media_id}
+
+        # The parked job carries the parsed config, so a YAML datetime is stored as local time
+        config = dict(config, scheduled_publish_time=scheduled_time.strftime('%Y-%m-%d %H:%M:%S'))
+        if datetime.now() < staging_time(scheduled_time):
+            return self.defer(job, staging_time(scheduled_time), config=config)
+
+        uploaded = post.upload_folder(job['folder'], config)
+        if not uploaded:
+            return {'success': False, 'error': 'Validation or upload failed'}
+        creation_id = post.stage_post(uploaded['media_items'], uploaded['uploaded_files'], config)
+        if not creation_id:
+            return {'success': False, 'error': 'Failed to create Instagram post'}
+
+        print(f"📦 Container {creation_id} ready, publishing at {scheduled_time:%Y-%m-%d %H:%M:%S}")
+        return self.defer(job, scheduled_time - FINAL_CHECK_LEAD, type='publish', config=config,
+                          creation_id=creation_id, **uploaded)
+
+    def run_publish(self, job):
+        """Second half of a scheduled post: check the staged container and publish it on time"""
+        post = self.instagram_post
+        config = job['config']
+        target = parse_scheduled_time(config['scheduled_publish_time'])
+        if datetime.now() < target - FINAL_CHECK_LEAD:
+            return self.defer(job, target - FINAL_CHECK_LEAD)
+
+        creation_id = job['creation_id']
+        status = check_container(creation_id)
+        if status in ('ERROR', 'EXPIRED'):
+            print(f"🔄 Container {creation_id} is {status}, staging it again")
+            creation_id = post.stage_post(job['media_items'], job['uploaded_files'], config)
+            if not creation_id:
+                return {'success': False, 'error': f"Container was {status} and could not be staged again"}
+
+        sleep_until(target)
+        print(f"🚀 Publishing at {datetime.now():%H:%M:%S} ({(datetime.now() - target).total_seconds():+.1f}s from schedule)")
+        media_id = post.publish_post(creation_id, config)
+        post.finish_post(media_id, job['media_items'], job['uploaded_files'], job['public_ids'])
+        return {'success': media_id is not None, 'media_id': media_id}
+
+    def run_reel(self, job):
+        reels = self.instagram_reels.InstagramReels()
+        return reels.post_reel(
+            job['video'],
+            job.get('caption', ''),
+            extract_cover=job.get('extract_cover', False),
+            cover_timestamp=job.get('cover_timestamp'),
+            transcode=job.get('transcode', False),
+        )
+
+    def run_story(self, job):
+        media_ids = self.instagram_stories.post_story_batch(job['media'])
+        return {'success': bool(media_ids), 'media_ids': media_ids}
+
+    def claim_jobs(self, limit, max_rank=None):
+        """
+        Move up to `limit` queued jobs to processing/ and return their paths
+
+        Jobs are claimed most urgent lane first, oldest first within a lane;
+        with `max_rank`, only jobs of that lane or a more urgent one.
+        """
+        incoming = os.path.join(self.spool_dir, 'incoming')
+        claimed = []
+        names = sorted((name for name in os.listdir(incoming) if name.endswith('.json')),
+                       key=lambda name: (spool_rank(name), name))
+        for name in names:
+            if len(claimed) >= limit:
+                break
+            if max_rank is not None and spool_rank(name) > max_rank:
+                break
+            target = os.path.join(self.spool_dir, 'processing', name)
+            try:
+                # Rename is atomic, so several workers can share a spool
+                os.rename(os.path.join(incoming, name), target)
+            except OSError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    def release_due_jobs(self):
+        """Move parked jobs whose time has come back to incoming/"""
+        deferred = os.path.join(self.spool_dir, 'deferred')
+        now = time.time()
+        for name in sorted(os.listdir(deferred)):
+            due, _, queued_name = name.partition('-')
+            if not name.endswith('.json') or not due.isdigit():
+                continue
+            if int(due) > now:
+                break
+            try:
+                os.rename(os.path.join(deferred, name), os.path.join(self.spool_dir, 'incoming', queued_name))
+            except OSError:
+                continue
+
+    def park(self, job_path, job):
+        """Rewrite a claimed job and move it to deferred/; both steps are atomic, so a crash loses nothing"""
+        tmp_path = f"{job_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, job_path)
+        os.replace(job_path, os.path.join(self.spool_dir, 'deferred', deferred_name(job)))
+
+    def process(self, job_path):
+        """Run one claimed job in its priority lane and file it under done/ or failed/"""
+        name = os.path.basename(job_path)
+        job_id = name[:-len('.json')]
+        started = time.time()
+
+        try:
+            with open(job_path, 'r') as f:
+                job = json.load(f)
+            job_id = job.get('id', job_id)
+            handler = self.handlers.get(job.get('type'))
+            if not handler:
+                raise ValueError(f"Unknown job type: {job.get('type')}")
+
+            job_priority = job_lane(job)
+            self.refresh_env()
+            self.write_status(job_id, 'running', type=job['type'], priority=job_priority,
+                              started_at=datetime.now().isoformat(timespec='seconds'))
+            print(f"▶️ Job {job_id} ({job['type']}, {job_priority}) started")
+
+            with lane(job_priority):
+                result = handler(job)
+            if result.get('deferred'):
+                # Waiting for a scheduled time does not hold a slot
+                parked = result['deferred']
+                self.park(job_path, parked)
+                self.write_status(job_id, 'deferred', type=parked['type'], priority=job_priority,
+                                  not_before=parked['not_before'])
+                print(f"⏸️ Job {job_id} ({parked['type']}) parked until {parked['not_before']}")
+                return
+            success = bool(result.get('success'))
+            details = {'result': result}
+        except Exception as e:
+            success = False
+            details = {'error': str(e), 'traceback': traceback.format_exc()}
+
+        elapsed = time.time() - started
+        status = 'done' if success else 'failed'
+        os.replace(job_path, os.path.join(self.spool_dir, status, name))
+        self.write_status(job_id, status, elapsed_seconds=round(elapsed, 1), **details)
+        print(f"{'✅' if success else '❌'} Job {job_id} {status} in {elapsed:.1f}s")
+
+    def run(self):
+        """Watch the spool until interrupted"""
+        print(f"👷 Posting worker started ({self.max_workers} concurrent jobs, spool: {self.spool_dir})")
+
+        # Jobs left in processing/ by a previous crash are picked up again
+        processing = os.path.join(self.spool_dir, 'processing')
+        for name in os.listdir(processing):
+            if name.endswith('.json'):
+                os.replace(os.path.join(processing, name), os.path.join(self.spool_dir, 'incoming', name))
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers + LIVE_RESERVED_SLOTS) as executor:
+            try:
+                while not self.stopping:
+                    self.release_due_jobs()
+                    in_flight = {future for future in in_flight if not future.done()}
+                    free_slots = self.max_workers - len(in_flight)
+                    if free_slots > 0:
+                        claimed = self.claim_jobs(free_slots)
+                    else:
+                        # Regular slots are full: live jobs may still take a reserved one
+                        claimed = self.claim_jobs(free_slots + LIVE_RESERVED_SLOTS, max_rank=LIVE)
+                    for job_path in claimed:
+                        in_flight.add(executor.submit(self.process, job_path))
+                    time.sleep(self.poll_interval)
+            except KeyboardInterrupt:
+                print("\n🛑 Stopping, waiting for running jobs to finish...")
+
+def main():
+    # --profile DIR (or PROFILE_DIR) profiles every job's stages; the report is written on exit
+    enable_from_argv()
+    parser = argparse.ArgumentParser(description="Resident Instagram posting worker")
+    parser.add_argument('--spool', default=os.path.join(PROJECT_ROOT, 'spool'), help="Spool directory")
+    parser.add_argument('--workers', type=int, default=4, help="Jobs run concurrently")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between spool scans")
+    args = parser.parse_args()
+
+    PostingWorker(args.spool, args.workers, args.poll_interval).run()
+
+if __name__ == "__main__":
+    main()
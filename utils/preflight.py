@@ -0,0 +1,323 @@
+import os
+import math
+import re
+import struct
+
+# Instagram publishing limits, see https://developers.facebook.com/docs/instagram-platform/instagram-graph-api/reference/ig-user/media
+CAPTION_MAX_LENGTH = 2200
+CAPTION_MAX_HASHTAGS = 30
+CAPTION_MAX_MENTIONS = 20
+CAROUSEL_MAX_ITEMS = 10
+
+IMAGE_MAX_BYTES = 8 * 1024 * 1024
+
+SURFACE_LIMITS = {
+    # min/max aspect ratio (width / height), min/max video duration in seconds, max video bytes
+    'feed': {'aspect': (4 / 5, 1.91), 'duration': (3, 60), 'video_bytes': 100 * 1024 * 1024},
+    'carousel': {'aspect': (4 / 5, 1.91), 'duration': (3, 60), 'video_bytes': 100 * 1024 * 1024},
+    'reels': {'aspect': (0.01, 10), 'duration': (3, 15 * 60), 'video_bytes': 300 * 1024 * 1024},
+    'stories': {'aspect': (0.1, 10), 'duration': (3, 60), 'video_bytes': 100 * 1024 * 1024},
+}
+
+VIDEO_CODECS = {'avc1', 'avc3', 'hvc1', 'hev1'}
+AUDIO_CODECS = {'mp4a'}
+
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+def read_png_size(f):
+    """Width and height from the PNG IHDR chunk"""
+    header = f.read(24)
+    if len(header) < 24 or header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+def read_jpeg_size(f):
+    """Width and height from the first JPEG start-of-frame segment, skipping over other segments"""
+    if f.read(2) != b'\xff\xd8':
+        return None
+
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            # Markers without a length field
+            continue
+        if marker == 0xD9:
+            return None
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+
+        if marker in JPEG_SOF_MARKERS:
+            segment = f.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack('>HH', segment[1:5])
+            return width, height
+
+        f.seek(length - 2, os.SEEK_CUR)
+
+def read_image_info(path):
+    """
+    Read image dimensions from the file header without decoding
+
+    Returns:
+        dict: {'format', 'width', 'height'} or None if the header is not recognised
+    """
+    with open(path, 'rb') as f:
+        signature = f.read(2)
+        f.seek(0)
+        if signature == b'\xff\xd8':
+            size, image_format = read_jpeg_size(f), 'jpeg'
+        else:
+            size, image_format = read_png_size(f), 'png'
+
+    if not size:
+        return None
+    return {'format': image_format, 'width': size[0], 'height': size[1]}
+
+def iter_boxes(f, start, end):
+    """
+    Iterate over ISO base media (MP4) boxes between two offsets
+
+    Yields:
+        tuple: (box_type, box_offset, box_size, header_size)
+    """
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+
+        if size < header_size:
+            return
+
+        yield box_type, offset, size, header_size
+        offset += size
+
+def find_top_level_boxes(path):
+    """Offsets and sizes of the top-level MP4 boxes (only headers are read)"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        return [(box_type, offset, size) for box_type, offset, size, _ in iter_boxes(f, 0, file_size)]
+
+def parse_track(f, start, end, track):
+    """Collect dimensions, handler type and codec of one trak box"""
+    for box_type, offset, size, header_size in iter_boxes(f, start, end):
+        body = offset + header_size
+
+        if box_type in CONTAINER_BOXES:
+            parse_track(f, body, offset + size, track)
+        elif box_type == b'tkhd':
+            f.seek(body)
+            version = f.read(1)[0]
+            # The 3x3 display matrix is followed by width and height (16.16 fixed point)
+            # at the end of the box
+            f.seek(offset + size - 44)
+            a, b, _, c, d, _, _, _, _, width, height = struct.unpack('>9i2I', f.read(44))
+            rotation = round(math.degrees(math.atan2(b, a))) % 360 if (a or b) else 0
+            width, height = width >> 16, height >> 16
+            # Phone videos are often stored landscape with a 90/270 degree matrix
+            if rotation in (90, 270):
+                width, height = height, width
+            track['width'] = width
+            track['height'] = height
+            track['rotation'] = rotation
+            track['tkhd_version'] = version
+        elif box_type == b'hdlr':
+            f.seek(body + 8)
+            track['handler'] = f.read(4)
+        elif box_type == b'stsd':
+            # version/flags (4), entry count (4), first entry size (4) and codec fourcc (4)
+            f.seek(body + 12)
+            track['codec'] = f.read(4).decode('ascii', 'replace')
+
+def read_mp4_info(path):
+    """
+    Read duration, resolution and codecs from the MP4 moov box without decoding
+
+    Returns:
+        dict: {'duration', 'width', 'height', 'rotation', 'video_codec', 'audio_codec',
+               'moov_offset', 'mdat_offset'}, or None if there is no moov box.
+               Width and height are as displayed, after the track's rotation.
+    """
+    file_size = os.path.getsize(path)
+    info = {'duration': None, 'width': None, 'height': None, 'rotation': 0, 'video_codec': None,
+            'audio_codec': None, 'moov_offset': None, 'mdat_offset': None}
+
+    with open(path, 'rb') as f:
+        moov = None
+        for box_type, offset, size, header_size in iter_boxes(f, 0, file_size):
+            if box_type == b'moov':
+                moov = (offset, size, header_size)
+                info['moov_offset'] = offset
+            elif box_type == b'mdat' and info['mdat_offset'] is None:
+                info['mdat_offset'] = offset
+
+        if not moov:
+            return None
+
+        moov_offset, moov_size, moov_header = moov
+        for box_type, offset, size, header_size in iter_boxes(f, moov_offset + moov_header, moov_offset + moov_size):
+            body = offset + header_size
+
+            if box_type == b'mvhd':
+                f.seek(body)
+                version = f.read(1)[0]
+                f.seek(3, os.SEEK_CUR)
+                if version == 1:
+                    _, _, timescale, duration = struct.unpack('>QQIQ', f.read(28))
+                else:
+                    _, _, timescale, duration = struct.unpack('>IIII', f.read(16))
+                if timescale:
+                    info['duration'] = duration / timescale
+            elif box_type == b'trak':
+                track = {}
+                parse_track(f, body, offset + size, track)
+                if track.get('handler') == b'vide':
+                    info['width'] = track.get('width')
+                    info['height'] = track.get('height')
+                    info['rotation'] = track.get('rotation', 0)
+                    info['video_codec'] = track.get('codec')
+                elif track.get('handler') == b'soun':
+                    info['audio_codec'] = track.get('codec')
+
+    return info
+
+def check_caption(config):
+    """
+    Check the combined caption against Instagram's limits
+
+    Returns:
+        list: (level, message) tuples
+    """
+    issues = []
+    caption = config.get('full_caption') or config.get('caption') or ''
+
+    if len(caption) > CAPTION_MAX_LENGTH:
+        issues.append(('error', f"Caption is {len(caption)} characters (max {CAPTION_MAX_LENGTH})"))
+
+    hashtags = re.findall(r'(?<!\w)#\w+', caption)
+    if len(hashtags) > CAPTION_MAX_HASHTAGS:
+        issues.append(('error', f"Caption has {len(hashtags)} hashtags (max {CAPTION_MAX_HASHTAGS})"))
+
+    mentions = re.findall(r'(?<!\w)@[\w.]+', caption)
+    if len(mentions) > CAPTION_MAX_MENTIONS:
+        issues.append(('error', f"Caption has {len(mentions)} @mentions (max {CAPTION_MAX_MENTIONS})"))
+
+    return issues
+
+def check_media_file(path, surface):
+    """
+    Check one media file against the limits of the target surface
+
+    Returns:
+        list: (level, message) tuples
+    """
+    issues = []
+    name = os.path.basename(path)
+    limits = SURFACE_LIMITS[surface]
+    file_size = os.path.getsize(path)
+
+    if path.lower().endswith(('.mp4', '.mov')):
+        try:
+            info = read_mp4_info(path)
+        except (OSError, struct.error, IndexError) as e:
+            return [('error', f"{name}: unreadable video header ({e})")]
+        if not info:
+            return [('error', f"{name}: no moov box found, file is not a valid MP4")]
+
+        if file_size > limits['video_bytes']:
+            issues.append(('error', f"{name}: {file_size / 1024 / 1024:.0f} MB exceeds {limits['video_bytes'] // 1024 // 1024} MB for {surface}"))
+
+        min_duration, max_duration = limits['duration']
+        if info['duration'] is not None and not min_duration <= info['duration'] <= max_duration:
+            issues.append(('error', f"{name}: duration {info['duration']:.1f}s outside {min_duration}-{max_duration}s for {surface}"))
+
+        if info['video_codec'] and info['video_codec'] not in VIDEO_CODECS:
+            issues.append(('error', f"{name}: video codec {info['video_codec']} is not H.264/HEVC"))
+        if info['audio_codec'] and info['audio_codec'] not in AUDIO_CODECS:
+            issues.append(('warning', f"{name}: audio codec {info['audio_codec']} is not AAC"))
+
+        width, height = info['width'], info['height']
+    else:
+        try:
+            info = read_image_info(path)
+        except (OSError, struct.error, IndexError) as e:
+            return [('error', f"{name}: unreadable image header ({e})")]
+        if not info:
+            return [('error', f"{name}: not a JPEG or PNG image")]
+
+        if file_size > IMAGE_MAX_BYTES:
+            issues.append(('error', f"{name}: {file_size / 1024 / 1024:.1f} MB exceeds 8 MB"))
+        if info['format'] != 'jpeg':
+            issues.append(('warning', f"{name}: Instagram only accepts JPEG, PNG may be rejected"))
+
+        width, height = info['width'], info['height']
+
+    if width and height:
+        min_ratio, max_ratio = limits['aspect']
+        ratio = width / height
+        # Allow for rounding in encoders (e.g. 1080x1351)
+        if not min_ratio - 0.01 <= ratio <= max_ratio + 0.01:
+            issues.append(('error', f"{name}: aspect ratio {width}x{height} ({ratio:.2f}) outside {min_ratio:.2f}-{max_ratio:.2f} for {surface}"))
+
+    return issues
+
+def run_preflight(media_files, config=None, surface=None):
+    """
+    Validate media files and caption before anything is uploaded
+
+    Args:
+        media_files (list): Local media paths
+        config (dict): Parsed post configuration (optional)
+        surface (str): 'feed', 'carousel', 'reels' or 'stories'. Inferred for feed posts
+            when omitted: several files are a carousel and a single video is a reel.
+
+    Returns:
+        dict: {'errors': [...], 'warnings': [...]}
+    """
+    if surface is None:
+        if len(media_files) > 1:
+            surface = 'carousel'
+        elif media_files and media_files[0].lower().endswith(('.mp4', '.mov')):
+            surface = 'reels'
+        else:
+            surface = 'feed'
+
+    issues = []
+    if surface == 'carousel' and len(media_files) > CAROUSEL_MAX_ITEMS:
+        issues.append(('error', f"{len(media_files)} files found, carousels allow at most {CAROUSEL_MAX_ITEMS}"))
+    if config:
+        issues.extend(check_caption(config))
+    for path in media_files:
+        issues.extend(check_media_file(path, surface))
+
+    return {
+        'errors': [message for level, message in issues if level == 'error'],
+        'warnings': [message for level, message in issues if level == 'warning'],
+    }
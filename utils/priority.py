@@ -0,0 +1,127 @@
+"""
+Priority lanes for work sharing one process (e.g. the posting worker)
+
+Every job runs in a lane: live (stories during live coverage), scheduled (regular
+posts and reels) or backfill (bulk campaigns, insights). Upload slots and Graph
+API calls go to the most urgent lane first; while more urgent work is running,
+scheduled transfers are throttled to half the slots and backfill transfers are
+paused between chunks. Nothing is cancelled, lower lanes simply wait.
+"""
+
+import os
+import threading
+import weakref
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+LIVE = 0
+SCHEDULED = 1
+BACKFILL = 2
+LANES = {'live': LIVE, 'scheduled': SCHEDULED, 'backfill': BACKFILL}
+
+# Concurrent Graph API requests per process
+GRAPH_CONCURRENCY = int(os.getenv('GRAPH_CONCURRENCY', 10))
+# Waiters also re-check this often, in case a wake-up is missed
+RECHECK_INTERVAL = 0.5
+
+_current_lane = contextvars.ContextVar('lane', default=SCHEDULED)
+_active = [0, 0, 0]
+_active_lock = threading.Lock()
+_gates = weakref.WeakSet()
+
+def lane_rank(name):
+    """Rank of a lane name ('live', 'scheduled', 'backfill')"""
+    if name not in LANES:
+        raise ValueError(f"Unknown priority lane '{name}', expected one of {', '.join(LANES)}")
+    return LANES[name]
+
+def current_lane():
+    return _current_lane.get()
+
+@contextmanager
+def lane(name):
+    """Run the enclosed work (and executors started from it) in a priority lane"""
+    rank = lane_rank(name)
+    token = _current_lane.set(rank)
+    with _active_lock:
+        _active[rank] += 1
+    try:
+        yield
+    finally:
+        with _active_lock:
+            _active[rank] -= 1
+        _current_lane.reset(token)
+        # Lower lanes may have been waiting for this one to finish
+        for gate in list(_gates):
+            gate.wake()
+
+def most_urgent_active():
+    """Most urgent lane with running work, or None"""
+    with _active_lock:
+        for rank, count in enumerate(_active):
+            if count:
+                return rank
+    return None
+
+def lane_capacity(rank, capacity):
+    """Slots a lane may fill while more urgent lanes are running"""
+    urgent = most_urgent_active()
+    if urgent is None or rank <= urgent:
+        return capacity
+    if rank == BACKFILL and urgent == LIVE:
+        return 0
+    return max(1, capacity // 2)
+
+class ContextExecutor(ThreadPoolExecutor):
+    """Thread pool whose tasks keep the submitter's lane"""
+
+    def submit(self, fn, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+class PriorityGate:
+    """Counting semaphore that hands free slots to the most urgent lane first"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_use = 0
+        self.waiting = [0, 0, 0]
+        self.condition = threading.Condition()
+        _gates.add(self)
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def can_start(self, rank, capacity):
+        """Whether a lane may take a slot now (called with the condition held)"""
+        if any(self.waiting[:rank]):
+            return False
+        return self.in_use < lane_capacity(rank, capacity)
+
+    def acquire(self):
+        rank = current_lane()
+        with self.condition:
+            self.waiting[rank] += 1
+            try:
+                while not self.can_start(rank, self.capacity):
+                    self.condition.wait(RECHECK_INTERVAL)
+            finally:
+                self.waiting[rank] -= 1
+            self.in_use += 1
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+graph_gate = PriorityGate(GRAPH_CONCURRENCY)
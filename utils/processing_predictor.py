@@ -0,0 +1,219 @@
+import os
+import json
+import struct
+import threading
+import time
+from datetime import datetime
+
+from utils.preflight import read_mp4_info
+from utils.container_status import wait_for_container
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Below this many observations the model is not trusted and status is polled as usual
+MIN_SAMPLES = 10
+# Check slightly before the predicted time; being early costs one poll, being late costs idle waiting
+EARLY_FACTOR = 0.9
+# Each video in a row that was already finished at the first check moves the
+# first check earlier by this factor, so an over-predicting model still gets
+# real observations to correct itself with
+EARLY_BACKOFF = 0.7
+MIN_EARLY_FACTOR = 0.2
+# Around the predicted time, status is checked this often (as a fraction of the
+# prediction, within these bounds) so observations are not rounded to the poll interval
+FAST_POLL_FRACTION = 0.05
+FAST_POLL_BOUNDS = (1.0, 5.0)
+# Fast polling stops at this multiple of the prediction
+FAST_POLL_UNTIL = 1.5
+# Small ridge term keeps the fit stable while the history has little variety
+RIDGE = 1e-3
+
+def video_features(path):
+    """
+    Features that drive Instagram's processing time, read from the file headers
+
+    Returns:
+        dict: {'size_mb', 'duration', 'megapixels'}, or None for non-MP4 or unreadable files
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        info = read_mp4_info(path)
+    except (OSError, struct.error, IndexError):
+        return None
+    if not info or not info['duration']:
+        return None
+    return {
+        'size_mb': os.path.getsize(path) / 1024 / 1024,
+        'duration': info['duration'],
+        'megapixels': (info['width'] or 0) * (info['height'] or 0) / 1e6,
+    }
+
+def feature_vector(features):
+    """Linear model inputs: intercept, size, duration, resolution and duration x resolution"""
+    return [
+        1.0,
+        features['size_mb'],
+        features['duration'],
+        features['megapixels'],
+        features['duration'] * features['megapixels'],
+    ]
+
+def solve(matrix, vector):
+    """Solve a small linear system by Gaussian elimination with partial pivoting"""
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, n + 1):
+                rows[r][c] -= factor * rows[col][c]
+    solution = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        solution[r] = (rows[r][n] - sum(rows[r][c] * solution[c] for c in range(r + 1, n))) / rows[r][r]
+    return solution
+
+class ProcessingPredictor:
+    """Least-squares model of container processing time, learned from posting history.
+
+    Each finished video container appends its features and observed
+    creation-to-FINISHED time to processing_history.jsonl. The normal equations
+    are accumulated as records come in, so fitting stays cheap however long the
+    history gets. A video that was already finished at the first check only
+    gives an upper bound on its processing time; it is stored as such but kept
+    out of the fit, and makes the next first check earlier instead.
+    """
+
+    def __init__(self, history_file=None):
+        self.history_file = history_file or os.path.join(PROJECT_ROOT, 'processing_history.jsonl')
+        size = len(feature_vector({'size_mb': 0, 'duration': 0, 'megapixels': 0}))
+        self.xtx = [[0.0] * size for _ in range(size)]
+        self.xty = [0.0] * size
+        self.samples = 0
+        self.coefficients = None
+        # Upper-bound-only records since the last real observation
+        self.censored_streak = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the append-only history file"""
+        if not os.path.exists(self.history_file):
+            return
+        with open(self.history_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry.get('upper_bound'):
+                        self.censored_streak += 1
+                    else:
+                        self.add(entry, entry['seconds'])
+                        self.censored_streak = 0
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def add(self, features, seconds):
+        """Add one observation to the normal equations"""
+        x = feature_vector(features)
+        for i, xi in enumerate(x):
+            self.xty[i] += xi * seconds
+            for j, xj in enumerate(x):
+                self.xtx[i][j] += xi * xj
+        self.samples += 1
+        self.coefficients = None
+
+    def fit(self):
+        """Coefficients of the current fit, or None while there is too little history"""
+        if self.samples < MIN_SAMPLES:
+            return None
+        if self.coefficients is None:
+            matrix = [[value + (RIDGE * self.samples if i == j and i > 0 else 0.0) for j, value in enumerate(row)]
+                      for i, row in enumerate(self.xtx)]
+            self.coefficients = solve(matrix, self.xty)
+        return self.coefficients
+
+    def predict(self, features):
+        """
+        Predicted seconds from container creation to FINISHED
+
+        Returns:
+            float: Prediction, or None without features or enough history
+        """
+        if not features:
+            return None
+        with self.lock:
+            coefficients = self.fit()
+        if not coefficients:
+            return None
+        return max(1.0, sum(c * x for c, x in zip(coefficients, feature_vector(features))))
+
+    def early_factor(self):
+        """Fraction of the prediction at which to check first"""
+        return max(MIN_EARLY_FACTOR, EARLY_FACTOR * EARLY_BACKOFF ** self.censored_streak)
+
+    def record(self, features, seconds, upper_bound=False):
+        """Append an observation to the history and, unless it is only an upper bound, to the model"""
+        entry = dict(features, seconds=round(seconds, 2), recorded_at=datetime.now().isoformat(timespec='seconds'))
+        if upper_bound:
+            entry['upper_bound'] = True
+        with self.lock:
+            with open(self.history_file, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            if upper_bound:
+                self.censored_streak += 1
+            else:
+                self.add(features, seconds)
+                self.censored_streak = 0
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+def get_predictor():
+    """Shared predictor, loaded once per process"""
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            _predictor = ProcessingPredictor()
+        return _predictor
+
+def wait_for_video(creation_id, video_path=None, timeout=300):
+    """
+    Wait for a video container, first checking around its predicted ready time
+
+    Call right after the container was created. With a local video file the
+    observed processing time is added to the history when it finishes; only
+    when an earlier check saw it still processing is that a real observation.
+
+    Returns:
+        dict: Last status response, as returned by wait_for_container
+    """
+    predictor = get_predictor()
+    features = video_features(video_path)
+    predicted = predictor.predict(features)
+    started = time.time()
+
+    timing = {}
+    if predicted:
+        low, high = FAST_POLL_BOUNDS
+        timing = {
+            'first_check_after': min(predicted * predictor.early_factor(), timeout),
+            'fast_interval': min(max(predicted * FAST_POLL_FRACTION, low), high),
+            'fast_until': predicted * FAST_POLL_UNTIL,
+        }
+        print(f"🔮 Processing predicted to take {predicted:.0f}s, first check in {timing['first_check_after']:.0f}s")
+
+    status = wait_for_container(creation_id, timeout, **timing)
+
+    if status.get('status_code') == 'FINISHED' and features:
+        elapsed = time.time() - started
+        # Finished at the first deferred check: it may have been ready well before
+        upper_bound = bool(predicted) and status.get('checks', 0) <= 1
+        predictor.record(features, elapsed, upper_bound=upper_bound)
+        if predicted:
+            qualifier = "at most " if upper_bound else ""
+            print(f"⏱️ Processed in {qualifier}{elapsed:.0f}s (predicted {predicted:.0f}s)")
+    return status
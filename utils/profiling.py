@@ -0,0 +1,163 @@
+"""
+Per-stage CPU and memory profiling for the posting scripts
+
+Enable with `--profile DIR` on any entry point (or the PROFILE_DIR environment
+variable). Each stage writes a cProfile file to DIR, and report.txt summarises
+wall time, CPU time (including ffmpeg child processes), peak Python memory and
+the top functions and allocation sites per stage.
+"""
+
+import os
+import sys
+import time
+import atexit
+import cProfile
+import io
+import pstats
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+_state = {'dir': None, 'stages': [], 'counter': 0}
+_local = threading.local()
+_lock = threading.Lock()
+_snapshot_filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+def enable_profiling(directory):
+    """Start collecting profiles into `directory`"""
+    if _state['dir']:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _state['dir'] = directory
+    # A few frames per allocation is enough to point at the caller
+    tracemalloc.start(5)
+    atexit.register(write_report)
+    print(f"🔬 Profiling enabled, writing to {directory}")
+
+def enable_from_argv(argv=None):
+    """
+    Enable profiling from `--profile DIR` (removed from argv) or PROFILE_DIR
+
+    Call this before the script reads its own arguments.
+    """
+    argv = sys.argv if argv is None else argv
+    if '--profile' in argv:
+        position = argv.index('--profile')
+        if position + 1 >= len(argv):
+            print("❌ --profile needs a directory")
+            sys.exit(1)
+        directory = argv[position + 1]
+        del argv[position:position + 2]
+        enable_profiling(directory)
+    elif os.getenv('PROFILE_DIR'):
+        enable_profiling(os.getenv('PROFILE_DIR'))
+
+def is_enabled():
+    return _state['dir'] is not None
+
+def cpu_times():
+    """CPU seconds used by this process and by finished child processes (ffmpeg)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime, children.ru_maxrss
+
+@contextmanager
+def profile_stage(name):
+    """
+    Profile a pipeline stage; does nothing unless profiling is enabled
+
+    cProfile only sees the calling thread, so nested stages and stages in worker
+    threads record timings but share the outer stage's CPU profile and memory peak.
+    """
+    if not is_enabled():
+        yield
+        return
+
+    with _lock:
+        _state['counter'] += 1
+        index = _state['counter']
+
+    profiler = None
+    if not getattr(_local, 'active', False):
+        profiler = cProfile.Profile()
+        _local.active = True
+
+    if profiler:
+        tracemalloc.reset_peak()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    # Allocation sites are compared against this, so memory held before the stage is left out
+    start_snapshot = tracemalloc.take_snapshot().filter_traces(_snapshot_filters)
+    start_cpu, start_child_cpu, _ = cpu_times()
+    started = time.time()
+    if profiler:
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            _local.active = False
+        wall = time.time() - started
+        end_cpu, end_child_cpu, child_maxrss = cpu_times()
+        current_memory, peak_memory = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(_snapshot_filters)
+        growth = [stat for stat in snapshot.compare_to(start_snapshot, 'lineno') if stat.size_diff > 0]
+
+        stage = {
+            'index': index,
+            'name': name,
+            'wall': wall,
+            'cpu': end_cpu - start_cpu,
+            'child_cpu': end_child_cpu - start_child_cpu,
+            'child_maxrss_mb': child_maxrss / 1024,
+            'peak_mb': (peak_memory - start_memory) / 1024 / 1024,
+            'retained_mb': (current_memory - start_memory) / 1024 / 1024,
+            'top_allocations': [
+                f"{stat.size_diff / 1024 / 1024:+8.2f} MB  {stat.traceback[0].filename}:{stat.traceback[0].lineno}"
+                for stat in growth[:10]
+            ],
+            'top_functions': '',
+        }
+
+        if profiler:
+            profile_path = os.path.join(_state['dir'], f"{index:02d}_{name}.prof")
+            profiler.dump_stats(profile_path)
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(15)
+            stage['top_functions'] = output.getvalue()
+
+        with _lock:
+            _state['stages'].append(stage)
+
+def write_report():
+    """Write report.txt with a summary of every profiled stage"""
+    if not _state['dir'] or not _state['stages']:
+        return
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    lines = [
+        f"Profile report - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"Command: {' '.join(sys.argv)}",
+        f"Peak process RSS: {peak_rss_mb:.1f} MB",
+        "",
+        f"{'stage':<28}{'wall s':>9}{'cpu s':>9}{'child cpu s':>13}{'peak py MB':>12}{'retained MB':>13}",
+    ]
+    for stage in sorted(_state['stages'], key=lambda s: s['index']):
+        lines.append(
+            f"{stage['index']:02d} {stage['name']:<25}{stage['wall']:>9.2f}{stage['cpu']:>9.2f}"
+            f"{stage['child_cpu']:>13.2f}{stage['peak_mb']:>12.1f}{stage['retained_mb']:>13.1f}"
+        )
+
+    for stage in sorted(_state['stages'], key=lambda s: s['index']):
+        lines += ["", "=" * 80, f"{stage['index']:02d} {stage['name']}", "=" * 80, "Top allocation growth (allocated during the stage, still held at its end):"]
+        lines += [f"  {line}" for line in stage['top_allocations']] or ["  (none)"]
+        if stage['top_functions']:
+            lines += ["", "Top functions by cumulative time:", stage['top_functions']]
+
+    report_path = os.path.join(_state['dir'], 'report.txt')
+    with open(report_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f"🔬 Profile report written to {report_path}")
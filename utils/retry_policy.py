@@ -0,0 +1,288 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+
+import requests
+import cloudinary.exceptions
+
+from utils.priority import ContextExecutor, graph_gate
+
+# Error classes
+TRANSIENT = 'transient'
+RATE_LIMITED = 'rate_limited'
+FATAL = 'fatal'
+
+# Graph API error codes, see https://developers.facebook.com/docs/graph-api/guides/error-handling
+GRAPH_TRANSIENT_CODES = {1, 2}
+GRAPH_RATE_LIMIT_CODES = {4, 17, 32, 613}
+# Unknown or invisible object IDs (e.g. a deleted container, a username that does not exist)
+GRAPH_NOT_FOUND_CODES = {100, 110, 803}
+
+# Shared session so every Graph API call reuses pooled keep-alive connections
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+# Hedged attempts keep the caller's priority lane
+_hedge_executor = ContextExecutor(max_workers=8)
+
+class CircuitOpenError(Exception):
+    """Raised when an endpoint's circuit breaker rejects a call"""
+
+def classify_graph_error(result, http_status=None):
+    """
+    Classify a Graph API response
+
+    Args:
+        result (dict): Parsed JSON response
+        http_status (int): HTTP status code of the response (optional)
+
+    Returns:
+        str: TRANSIENT, RATE_LIMITED or FATAL, or None for a successful response
+    """
+    error = result.get('error') if isinstance(result, dict) else None
+    if not error:
+        if http_status and http_status >= 500:
+            return TRANSIENT
+        return None
+
+    if not isinstance(error, dict):
+        return FATAL
+
+    code = error.get('code')
+    if code in GRAPH_RATE_LIMIT_CODES or (isinstance(code, int) and 80000 <= code < 80100) or http_status == 429:
+        return RATE_LIMITED
+    if error.get('is_transient') or code in GRAPH_TRANSIENT_CODES or (http_status and http_status >= 500):
+        return TRANSIENT
+    return FATAL
+
+def has_retryable_code(result):
+    """Whether a well-formed Graph API error carries an explicit rate-limit or transient code"""
+    error = result.get('error') if isinstance(result, dict) else None
+    if not isinstance(error, dict):
+        return False
+    code = error.get('code')
+    return (code in GRAPH_RATE_LIMIT_CODES or code in GRAPH_TRANSIENT_CODES
+            or (isinstance(code, int) and 80000 <= code < 80100))
+
+def classify_exception(error):
+    """Classify an exception raised by requests or the Cloudinary SDK"""
+    if isinstance(error, CircuitOpenError):
+        return FATAL
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return TRANSIENT
+    if isinstance(error, cloudinary.exceptions.RateLimited):
+        return RATE_LIMITED
+    if isinstance(error, cloudinary.exceptions.GeneralError):
+        return TRANSIENT
+    # The SDK raises the base Error for socket errors and unexpected 5xx responses
+    if type(error) is cloudinary.exceptions.Error:
+        return TRANSIENT
+    return FATAL
+
+def endpoint_key(url):
+    """Group URLs into endpoints for circuit breaking (node IDs are collapsed)"""
+    parsed = urlparse(url)
+    edge = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+    if edge.isdigit():
+        edge = 'node'
+    return f"{parsed.netloc}/{edge}"
+
+class CircuitBreaker:
+    """Stop calling an endpoint after repeated failures, then probe it again after a cool-down"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go through (closed, or half-open probe)"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # Half-open: let one probe through and re-open on failure
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+class RetryPolicy:
+    """Retry transient and rate-limited failures with jittered exponential backoff"""
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, rate_limit_delay=60.0,
+                 failure_threshold=5, reset_timeout=60):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_delay = rate_limit_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        """Get (or create) the circuit breaker for an endpoint"""
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[endpoint]
+
+    def delay(self, attempt, error_class, retry_after=None):
+        """Seconds to wait before the next attempt"""
+        if retry_after:
+            return min(float(retry_after), self.max_delay * 4)
+        if error_class == RATE_LIMITED:
+            return self.rate_limit_delay * random.uniform(0.8, 1.2)
+        # Full jitter keeps parallel jobs from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, func, *args, endpoint=None, breaker=None, **kwargs):
+        """
+        Call a function that raises on failure (e.g. the Cloudinary SDK), retrying transient errors
+
+        Args:
+            func (callable): Function to call
+            endpoint (str): Circuit breaker key (defaults to the function name)
+            breaker (CircuitBreaker): Private breaker to use instead of the endpoint's shared one
+
+        Returns:
+            The function's return value; the last exception is re-raised when retries run out
+        """
+        endpoint = endpoint or getattr(func, '__name__', 'call')
+        breaker = breaker or self.breaker(endpoint)
+
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {endpoint}, skipping call")
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error_class = classify_exception(e)
+                if error_class == FATAL:
+                    raise
+                breaker.record_failure()
+                if attempt == self.max_attempts - 1:
+                    raise
+                wait_time = self.delay(attempt, error_class)
+                print(f"  🔁 {error_class.replace('_', ' ').capitalize()} error ({e}), retrying in {wait_time:.1f}s...")
+                time.sleep(wait_time)
+                continue
+
+            breaker.record_success()
+            return result
+
+    def send(self, method, url, timeout, **kwargs):
+        """Send one HTTP request and parse the JSON body"""
+        # Urgent lanes get Graph API slots first
+        with graph_gate.slot():
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        try:
+            result = response.json()
+        except ValueError:
+            result = {'error': {'message': f'Non-JSON response (HTTP {response.status_code})'}}
+        return response, result
+
+    def hedged_send(self, method, url, timeout, hedge_after, **kwargs):
+        """Send a request and, if it is slow, a second identical one; the first answer wins"""
+        first = _hedge_executor.submit(self.send, method, url, timeout, **kwargs)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+
+        second = _hedge_executor.submit(self.send, method, url, timeout, **kwargs)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+        # Both attempts raised; surface the first one's exception
+        return first.result()
+
+    def graph_request(self, method, url, idempotent=None, hedge_after=None, timeout=60, **kwargs):
+        """
+        Make a Graph API request with retries and circuit breaking
+
+        Args:
+            method (str): HTTP method
+            url (str): Request URL
+            idempotent (bool): Whether the call can be repeated safely. Defaults to True for
+                GET. Non-idempotent calls are only retried on an explicit rate-limit or
+                transient error code or a connect timeout, never after a 5xx or a read
+                timeout where the request may have been applied.
+            hedge_after (float): For idempotent calls, send a second request if the first
+                has not answered after this many seconds
+            timeout (float): Per-request timeout in seconds
+
+        Returns:
+            dict: Parsed JSON response, or an {'error': {...}} dict
+        """
+        if idempotent is None:
+            idempotent = method.upper() == 'GET'
+        endpoint = endpoint_key(url)
+        breaker = self.breaker(endpoint)
+        result = None
+
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                return {'error': {'message': f'Circuit open for {endpoint}, skipping call', 'type': 'CircuitOpen'}}
+
+            retry_after = None
+            try:
+                if idempotent and hedge_after:
+                    response, result = self.hedged_send(method, url, timeout, hedge_after, **kwargs)
+                else:
+                    response, result = self.send(method, url, timeout, **kwargs)
+                error_class = classify_graph_error(result, response.status_code)
+                retry_after = response.headers.get('Retry-After')
+                # A write answered by a 5xx may still have been applied
+                if not idempotent and error_class in (TRANSIENT, RATE_LIMITED) and not has_retryable_code(result):
+                    breaker.record_failure()
+                    return result
+            except requests.RequestException as e:
+                result = {'error': {'message': f'Request failed: {e}'}}
+                error_class = classify_exception(e)
+                # A failed write may already have been applied unless it never connected
+                if not idempotent and not isinstance(e, requests.ConnectTimeout):
+                    error_class = FATAL
+
+            if error_class is None:
+                breaker.record_success()
+                return result
+            if error_class == FATAL:
+                # Fatal errors are about the request, not the endpoint's health
+                return result
+
+            breaker.record_failure()
+            if attempt < self.max_attempts - 1:
+                wait_time = self.delay(attempt, error_class, retry_after)
+                print(f"  🔁 {error_class.replace('_', ' ').capitalize()} Graph API error, retrying in {wait_time:.1f}s...")
+                time.sleep(wait_time)
+
+        return result
+
+# Shared default policy
+default_policy = RetryPolicy()
+
+def graph_request(method, url, **kwargs):
+    """Make a Graph API request with the default retry policy"""
+    return default_policy.graph_request(method, url, **kwargs)
+
+def retry_call(func, *args, **kwargs):
+    """Call a raising function (e.g. a Cloudinary upload) with the default retry policy"""
+    return default_policy.call(func, *args, **kwargs)
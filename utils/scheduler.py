@@ -0,0 +1,112 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from utils.retry_policy import graph_request
+
+# Media containers expire 24 hours after they are created
+CONTAINER_LIFETIME = timedelta(hours=24)
+# Containers are re-created when they would be older than this at publish time
+REFRESH_MARGIN = timedelta(hours=1)
+# The container is checked once more this long before the target, which also
+# warms the pooled connection so the publish call goes straight out
+FINAL_CHECK_LEAD = timedelta(seconds=60)
+SCHEDULE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M')
+
+def parse_scheduled_time(value):
+    """
+    Parse scheduled_publish_time from post.yaml (local time)
+
+    YAML already turns unquoted timestamps into datetime objects, so both
+    datetimes and 'YYYY-MM-DD HH:MM[:SS]' strings are accepted.
+
+    Returns:
+        datetime: Scheduled time, or None when empty
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        # Aware datetimes are converted to naive local time for comparison with datetime.now()
+        return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+    for fmt in SCHEDULE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid scheduled_publish_time '{value}', expected YYYY-MM-DD HH:MM:SS")
+
+def sleep_until(target):
+    """Sleep until a local datetime, waking up often enough to land within milliseconds"""
+    while True:
+        remaining = (target - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return
+        # Long sleeps drift (and a suspended laptop oversleeps), so re-check at least every minute
+        time.sleep(min(remaining, 60) if remaining > 1 else remaining)
+
+def check_container(creation_id):
+    """Current status_code of a media container, or None if it could not be fetched"""
+    result = graph_request('GET', f"https://graph.facebook.com/v18.0/{creation_id}",
+                           params={'fields': 'status_code', 'access_token': os.getenv('ACCESS_TOKEN')})
+    if 'error' in result:
+        # Unknown rather than failed: publishing is still attempted at the target time
+        return None
+    return result.get('status_code')
+
+def staging_time(target):
+    """Earliest time a post due at `target` can be staged without its container expiring first"""
+    return target - (CONTAINER_LIFETIME - REFRESH_MARGIN)
+
+def publish_at(target, stage, publish):
+    """
+    Stage a post ahead of time and publish it at the exact scheduled moment
+
+    `stage` creates the containers and waits for processing; it runs as early as
+    possible while the container still lives until the target time, and again
+    whenever a staged container expires or fails before then. At the target time
+    only `publish` (the media_publish call) is left to do.
+
+    Args:
+        target (datetime): Local time to publish at
+        stage (callable): Returns a ready creation ID, or None on failure
+        publish (callable): Publishes a creation ID and returns the media ID
+
+    Returns:
+        str: Published media ID, or None on failure
+    """
+    while True:
+        earliest_stage = staging_time(target)
+        if datetime.now() < earliest_stage:
+            print(f"\n⏰ Post is due {target:%Y-%m-%d %H:%M:%S}; containers expire after 24h, "
+                  f"staging at {earliest_stage:%Y-%m-%d %H:%M:%S}")
+            sleep_until(earliest_stage)
+
+        creation_id = stage()
+        if not creation_id:
+            return None
+        staged_at = datetime.now()
+        print(f"\n📦 Container {creation_id} ready, publishing in {format_delay(target - staged_at)} "
+              f"at {target:%Y-%m-%d %H:%M:%S}")
+
+        sleep_until(target - FINAL_CHECK_LEAD)
+        status = check_container(creation_id)
+        if status in ('ERROR', 'EXPIRED'):
+            print(f"🔄 Container {creation_id} is {status}, staging it again")
+            continue
+
+        sleep_until(target)
+        lateness = (datetime.now() - target).total_seconds()
+        print(f"\n🚀 Publishing at {datetime.now():%H:%M:%S} ({lateness:+.1f}s from schedule)")
+        return publish(creation_id)
+
+def format_delay(delta):
+    """Human readable duration, e.g. '3h 12m'"""
+    seconds = max(0, int(delta.total_seconds()))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
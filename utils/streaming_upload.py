@@ -0,0 +1,87 @@
+import os
+import uuid
+
+# Bytes read from disk per read() call; the whole body is never held in memory
+BLOCK_SIZE = 1024 * 1024
+
+class MultipartFileStream:
+    """multipart/form-data body that streams one file (or a byte range of it) from disk.
+
+    requests sends any object with read() and __len__() as a streamed body with
+    a Content-Length header, so memory per transfer stays at one block however
+    large the file is. Pass it as `data=` together with `headers={'Content-Type':
+    stream.content_type}` instead of using `files=`.
+    """
+
+    def __init__(self, fields, file_field, file_path, filename=None, start=0, length=None,
+                 file_content_type='application/octet-stream', block_size=BLOCK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.file_path = file_path
+        self.start = start
+        self.length = os.path.getsize(file_path) - start if length is None else length
+        self.block_size = block_size
+
+        head = []
+        for name, value in (fields or {}).items():
+            if value is None:
+                continue
+            # Lists are sent the way the Cloudinary SDK sends them, as repeated name[] fields
+            values = value if isinstance(value, (list, tuple)) else [value]
+            field_name = f"{name}[]" if isinstance(value, (list, tuple)) else name
+            for item in values:
+                head.append(self.part_header(field_name) + str(item).encode() + b"\r\n")
+        filename = filename or os.path.basename(file_path)
+        head.append(self.part_header(file_field, filename, file_content_type))
+
+        self.head = b"".join(head)
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.position = 0
+        self.file = None
+
+    def part_header(self, name, filename=None, content_type=None):
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode()
+
+    def __len__(self):
+        return len(self.head) + self.length + len(self.tail)
+
+    def read(self, size=-1):
+        """Return up to `size` bytes of the body (at most one block when size is -1)"""
+        if size is None or size < 0 or size > self.block_size:
+            size = self.block_size
+
+        head_end = len(self.head)
+        file_end = head_end + self.length
+        if self.position < head_end:
+            data = self.head[self.position:self.position + size]
+        elif self.position < file_end:
+            if self.file is None:
+                self.file = open(self.file_path, 'rb')
+                self.file.seek(self.start)
+            data = self.file.read(min(size, file_end - self.position))
+            if not data:
+                raise IOError(f"{self.file_path} is shorter than expected")
+        else:
+            data = self.tail[self.position - file_end:self.position - file_end + size]
+            if not data:
+                self.close()
+
+        self.position += len(data)
+        return data
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+from dotenv import load_dotenv
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
+
+from utils.retry_policy import graph_request, classify_graph_error, FATAL, GRAPH_NOT_FOUND_CODES
+
+# Graph API accepts at most 50 requests per batch call
+MAX_BATCH_SIZE = 50
+
+def is_not_found(body):
+    """Whether a lookup error means the username or location does not exist"""
+    error = body.get('error')
+    return isinstance(error, dict) and error.get('code') in GRAPH_NOT_FOUND_CODES
+
+class TagResolver:
+    """Validate usernames and location IDs before any media is uploaded.
+
+    Lookups are sent as a single Graph API batch request and the results are
+    kept in a JSON cache with a TTL, so partners and venues that are tagged
+    over and over are only checked against the API once in a while.
+    """
+
+    def __init__(self, cache_file=None, ttl=7 * 86400, negative_ttl=3600):
+        self.access_token = os.getenv('ACCESS_TOKEN')
+        self.account_id = os.getenv('ACCOUNT_ID')
+        self.cache_file = cache_file or os.path.join(PROJECT_ROOT, 'tag_cache.json')
+        self.ttl = ttl
+        # Failed lookups expire sooner so a fixed account or venue is picked up quickly
+        self.negative_ttl = negative_ttl
+        self.cache = self.load_cache()
+
+    def load_cache(self):
+        """Load the resolution cache from disk"""
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    cache = json.load(f)
+                cache.setdefault('users', {})
+                cache.setdefault('locations', {})
+                return cache
+            except (ValueError, OSError) as e:
+                print(f"⚠️ Ignoring unreadable tag cache: {e}")
+        return {'users': {}, 'locations': {}}
+
+    def save_cache(self):
+        """Write the resolution cache atomically"""
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.cache, f, indent=2)
+        os.replace(tmp_file, self.cache_file)
+
+    def cached(self, kind, key):
+        """Return a cache entry if it is still fresh"""
+        entry = self.cache[kind].get(key)
+        if not entry:
+            return None
+        ttl = self.ttl if entry['valid'] else self.negative_ttl
+        if time.time() - entry['checked_at'] > ttl:
+            return None
+        return entry
+
+    def user_request(self, username):
+        """Batch entry looking up a username through Business Discovery"""
+        return {
+            'method': 'GET',
+            'relative_url': f"{self.account_id}?fields=business_discovery.username({username}){{id,username}}"
+        }
+
+    def location_request(self, location_id):
+        """Batch entry looking up a location page"""
+        return {
+            'method': 'GET',
+            'relative_url': f"{location_id}?fields=id,name,location"
+        }
+
+    def run_batch(self, lookups):
+        """
+        Execute lookups through the Graph API batch endpoint
+
+        Args:
+            lookups (list): (kind, key, request) tuples
+
+        Returns:
+            list: Parsed response bodies in the same order, None for transport
+                  failures and for errors that say nothing about the tag itself
+                  (throttling, an expired token, server errors)
+        """
+        results = []
+
+        for start in range(0, len(lookups), MAX_BATCH_SIZE):
+            chunk = lookups[start:start + MAX_BATCH_SIZE]
+            params = {
+                'batch': json.dumps([request for _, _, request in chunk]),
+                'include_headers': 'false',
+                'access_token': self.access_token
+            }
+
+            # The batch only contains lookups, so it is safe to retry
+            responses = graph_request('POST', "https://graph.facebook.com/v18.0", data=params, idempotent=True)
+            if not isinstance(responses, list):
+                print(f"⚠️ Tag lookup failed: {responses.get('error', responses)}")
+                results.extend([None] * len(chunk))
+                continue
+
+            for (_, key, _), item in zip(chunk, responses):
+                if not item:
+                    results.append(None)
+                    continue
+                try:
+                    body = json.loads(item.get('body') or '{}')
+                except ValueError:
+                    results.append(None)
+                    continue
+
+                error_class = classify_graph_error(body, item.get('code'))
+                if error_class and not (error_class == FATAL and is_not_found(body)):
+                    error = body.get('error') or f"HTTP {item.get('code')}"
+                    print(f"⚠️ Could not look up {key}: {error.get('message', error) if isinstance(error, dict) else error}")
+                    body = None
+                results.append(body)
+
+        return results
+
+    def resolve(self, usernames=(), location_ids=()):
+        """
+        Resolve usernames and location IDs, using the cache where possible
+
+        Args:
+            usernames (iterable): Instagram usernames without @
+            location_ids (iterable): Facebook location page IDs
+
+        Returns:
+            dict: {'users': {username: entry}, 'locations': {location_id: entry}}
+                  where entry is None when the API could not be reached and a
+                  user entry's 'valid' is None when Business Discovery did not
+                  find the account (it may be a personal account)
+        """
+        resolved = {'users': {}, 'locations': {}}
+        lookups = []
+
+        for username in dict.fromkeys(u.lower() for u in usernames if u):
+            entry = self.cached('users', username)
+            if entry:
+                resolved['users'][username] = entry
+            else:
+                lookups.append(('users', username, self.user_request(username)))
+
+        for location_id in dict.fromkeys(str(l) for l in location_ids if l):
+            entry = self.cached('locations', location_id)
+            if entry:
+                resolved['locations'][location_id] = entry
+            else:
+                lookups.append(('locations', location_id, self.location_request(location_id)))
+
+        if not lookups:
+            return resolved
+
+        print(f"🔎 Checking {len(lookups)} tag(s)/location(s) against the Graph API...")
+        now = time.time()
+
+        for (kind, key, _), body in zip(lookups, self.run_batch(lookups)):
+            if body is None:
+                # The API could not answer: report as unknown and do not cache
+                resolved[kind][key] = None
+                continue
+
+            if kind == 'users':
+                # Business Discovery only sees Business and Creator accounts, so a
+                # miss may just be a personal account: unverified, not invalid
+                found = body.get('business_discovery')
+                entry = {'valid': True if found else None, 'id': found.get('id') if found else None}
+            else:
+                entry = {'valid': 'id' in body and 'error' not in body, 'name': body.get('name')}
+
+            if 'error' in body:
+                entry['error'] = body['error'].get('message', str(body['error']))
+            entry['checked_at'] = now
+
+            self.cache[kind][key] = entry
+            resolved[kind][key] = entry
+
+        self.save_cache()
+        return resolved
+
+    def validate_config(self, config):
+        """
+        Validate the user tags, collaborators and location of a post config
+
+        Args:
+            config (dict): Parsed post configuration
+
+        Returns:
+            list: Human readable problems, empty when everything resolved
+        """
+        user_tags = [u.lstrip('@') for u in config.get('user_tags') or [] if u]
+        collaborators = [u.lstrip('@') for u in config.get('collaborators') or [] if u]
+        location = config.get('location')
+
+        resolved = self.resolve(user_tags + collaborators, [location] if location else [])
+        problems = []
+
+        for username, entry in resolved['users'].items():
+            if entry is None:
+                print(f"  ⚠️ Could not verify @{username} (lookup unavailable)")
+            elif entry['valid'] is None:
+                print(f"  ⚠️ Could not verify @{username} (personal accounts can't be looked up)")
+            elif not entry['valid']:
+                problems.append(f"Unknown Instagram account @{username}: {entry.get('error', 'not found')}")
+
+        for location_id, entry in resolved['locations'].items():
+            if entry is None:
+                print(f"  ⚠️ Could not verify location {location_id} (lookup unavailable)")
+            elif not entry['valid']:
+                problems.append(f"Invalid location ID {location_id}: {entry.get('error', 'not found')}")
+
+        return problems
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.retry_policy import classify_exception, TRANSIENT, RATE_LIMITED
+from utils.priority import PriorityGate
+
+INITIAL_LEVEL = int(os.getenv('UPLOAD_CONCURRENCY_START', 2))
+MAX_LEVEL = int(os.getenv('UPLOAD_CONCURRENCY_MAX', 8))
+# Throughput must improve by this much for another stream to be worth adding,
+# and a drop below this fraction of the previous window counts as congestion
+INCREASE_THRESHOLD = 1.05
+CONGESTION_THRESHOLD = 0.8
+# Windows to wait after a probe that brought no gain
+HOLD_WINDOWS = 8
+
+class Transfer:
+    """Handle for one transfer; set `congested` when the server answered with a transient error"""
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+        self.congested = False
+
+class AdaptiveLimiter:
+    """Limit concurrent uploads to a level tuned by measured throughput (AIMD).
+
+    Every transfer takes a slot. After each window of completed transfers the
+    aggregate bytes per second is compared with the level before: while an extra
+    stream raises throughput the level keeps going up by one, when it does not
+    the level steps back and holds for a while, and when throughput drops sharply
+    or a transfer times out or is throttled the level is halved. Time with no
+    transfer in flight is not counted, so idle gaps do not look like a slow network.
+    Slots are handed out by priority lane (see utils/priority.py).
+    """
+
+    def __init__(self, initial=INITIAL_LEVEL, min_level=1, max_level=MAX_LEVEL, window=4):
+        self.level = max(min_level, min(initial, max_level))
+        self.min_level = min_level
+        self.max_level = max_level
+        self.window = window
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.gate = PriorityGate(self.level)
+
+        self.busy_time = 0.0
+        self.busy_since = None
+        # (level, bytes per second) measured before the last change
+        self.reference = None
+        self.hold_windows = 0
+        self.total_bytes = 0
+        self.total_busy_time = 0.0
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_bytes = 0
+        self.window_done = 0
+        self.window_errors = 0
+        self.busy_time = 0.0
+        if self.busy_since is not None:
+            self.busy_since = time.time()
+
+    def busy_seconds(self):
+        """Time with at least one transfer in flight since the window started"""
+        running = time.time() - self.busy_since if self.busy_since is not None else 0.0
+        return self.busy_time + running
+
+    @contextmanager
+    def transfer(self, nbytes):
+        """
+        Hold an upload slot for a transfer of `nbytes`
+
+        Exceptions are re-raised; timeouts, connection errors and throttling
+        count as congestion, other errors (bad request, auth) do not.
+        """
+        self.gate.acquire()
+        with self.lock:
+            if self.in_flight == 0:
+                self.busy_since = time.time()
+            self.in_flight += 1
+
+        handle = Transfer(nbytes)
+        congested = False
+        try:
+            yield handle
+        except Exception as e:
+            congested = classify_exception(e) in (TRANSIENT, RATE_LIMITED)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                if self.in_flight == 0:
+                    self.busy_time += time.time() - self.busy_since
+                    self.busy_since = None
+                self.record(handle.nbytes, congested or handle.congested)
+            self.gate.release()
+
+    def record(self, nbytes, congested):
+        """Account a finished transfer and adjust the level (called with the lock held)"""
+        if congested:
+            self.window_errors += 1
+        else:
+            self.window_bytes += nbytes
+            self.window_done += 1
+            self.total_bytes += nbytes
+
+        if self.window_errors:
+            self.total_busy_time += self.busy_seconds()
+            self.set_level(max(self.min_level, self.level // 2), "timeouts/throttling")
+            # Measure again from scratch at the lower level
+            self.reference = None
+            self.reset_window()
+            return
+
+        if self.window_done < max(self.window, self.level):
+            return
+
+        elapsed = max(self.busy_seconds(), 0.001)
+        throughput = self.window_bytes / elapsed
+        self.total_busy_time += elapsed
+        self.reset_window()
+
+        if self.reference is None:
+            # First window at this level: probe one stream higher
+            self.reference = (self.level, throughput)
+            self.increase(throughput)
+            return
+
+        reference_level, reference_throughput = self.reference
+        if self.level > reference_level:
+            if throughput >= reference_throughput * INCREASE_THRESHOLD:
+                self.reference = (self.level, throughput)
+                self.increase(throughput)
+            else:
+                # The extra stream did not help; go back and wait before probing again
+                self.set_level(reference_level, f"no gain at {format_rate(throughput)}")
+                self.hold_windows = HOLD_WINDOWS
+        elif throughput < reference_throughput * CONGESTION_THRESHOLD:
+            self.set_level(max(self.min_level, self.level // 2), f"throughput fell to {format_rate(throughput)}")
+            self.reference = None
+        else:
+            self.reference = (self.level, throughput)
+            if self.hold_windows:
+                self.hold_windows -= 1
+            else:
+                self.increase(throughput)
+
+    def increase(self, throughput):
+        if self.level < self.max_level:
+            self.set_level(self.level + 1, format_rate(throughput))
+
+    def set_level(self, level, reason):
+        if level != self.level:
+            print(f"  📶 Upload concurrency {self.level} → {level} ({reason})")
+            self.level = level
+            self.gate.capacity = level
+
+    def summary(self):
+        """One line with the current level and the average throughput so far"""
+        busy = self.total_busy_time + self.busy_seconds()
+        rate = self.total_bytes / busy if busy > 0 else 0
+        return f"{self.total_bytes / 1024 / 1024:.1f} MB uploaded at {format_rate(rate)}, concurrency level {self.level}"
+
+def format_rate(bytes_per_second):
+    return f"{bytes_per_second / 1024 / 1024:.1f} MB/s"
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_upload_limiter():
+    """Shared limiter for every upload made by this process"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+        return _limiter
@@ -0,0 +1,129 @@
+"""
+Memory benchmark for streamed multipart uploads
+
+Posts files of growing size to a local HTTP server that discards the body and
+reports the peak memory allocated while each request was sent. With
+MultipartFileStream the peak stays at about one block whatever the file size;
+--compare also sends the smaller files with requests' files=, which builds the
+whole body in memory.
+
+    python utils/upload_memory_benchmark.py --sizes 64,256,1024 --compare
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Add the project root to the path so we can import utils
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from utils.streaming_upload import MultipartFileStream
+
+MB = 1024 * 1024
+# files= needs the whole body in memory, so only compare up to this size
+COMPARE_LIMIT_MB = 256
+
+class DiscardHandler(BaseHTTPRequestHandler):
+    """Reads the request body in small pieces and throws it away"""
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            data = self.rfile.read(min(remaining, 64 * 1024))
+            if not data:
+                break
+            remaining -= len(data)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+def make_file(directory, size_mb):
+    """Sparse file of `size_mb` MB, so the benchmark does not need the disk space"""
+    path = os.path.join(directory, f"upload_{size_mb}mb.bin")
+    with open(path, 'wb') as f:
+        f.truncate(size_mb * MB)
+    return path
+
+def peak_memory(send):
+    """Peak bytes allocated by Python while `send()` runs"""
+    tracemalloc.start()
+    try:
+        send()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def send_streamed(url, path):
+    with MultipartFileStream({'access_token': 'benchmark'}, 'source', path) as body:
+        response = requests.post(url, data=body, headers={'Content-Type': body.content_type})
+    response.raise_for_status()
+
+def send_in_memory(url, path):
+    with open(path, 'rb') as f:
+        response = requests.post(url, data={'access_token': 'benchmark'}, files={'source': f})
+    response.raise_for_status()
+
+def run_benchmark(sizes, compare=False):
+    """
+    Measure peak upload memory for each file size
+
+    Returns:
+        list: One dict per size with 'size_mb', 'streamed' and 'in_memory' (bytes, or None)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DiscardHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/upload"
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='upload_benchmark_') as directory:
+            for size_mb in sizes:
+                path = make_file(directory, size_mb)
+                streamed = peak_memory(lambda: send_streamed(url, path))
+                in_memory = None
+                if compare and size_mb <= COMPARE_LIMIT_MB:
+                    in_memory = peak_memory(lambda: send_in_memory(url, path))
+                results.append({'size_mb': size_mb, 'streamed': streamed, 'in_memory': in_memory})
+                os.remove(path)
+
+                line = f"  {size_mb:>6} MB file: streamed peak {streamed / MB:6.2f} MB"
+                if in_memory is not None:
+                    line += f", files= peak {in_memory / MB:8.2f} MB"
+                print(line)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure upload memory as file size grows")
+    parser.add_argument('--sizes', default='16,64,256,1024', help="Comma-separated file sizes in MB")
+    parser.add_argument('--compare', action='store_true',
+                        help=f"Also send files up to {COMPARE_LIMIT_MB} MB with requests' files=")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    print(f"📏 Upload memory benchmark ({', '.join(str(size) for size in sizes)} MB)")
+    results = run_benchmark(sizes, args.compare)
+
+    peaks = [result['streamed'] for result in results]
+    spread = (max(peaks) - min(peaks)) / MB
+    if spread < 1:
+        print(f"\n✅ Streamed footprint is flat: {max(peaks) / MB:.2f} MB peak across all sizes")
+    else:
+        print(f"\n⚠️ Streamed footprint grew by {spread:.2f} MB between the smallest and largest file")
+
+if __name__ == "__main__":
+    main()